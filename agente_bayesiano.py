@@ -12,7 +12,10 @@ Definición de las clases usadas en el agente lógico bayesiano.
 
 # Import necessary modules
 
+import math
 import random
+
+import numpy as np
 from colorama import Fore
 
 
@@ -32,20 +35,52 @@ class Room:
         return f"{self.color}{self.element}{Fore.RESET}"
 
 
+# Flags of a cell of the board: the items in it and Captain Willard (who may
+# travel with Kurtz); co-located items are the bitwise OR of their flags
+FIRE, SPIKES, DARTS, MONSTER, EXIT, KURTZ, CAPTAIN, WITH_KURTZ = (1 << bit for bit in range(8))
+TRAPS = FIRE | SPIKES | DARTS
+ITEMS = TRAPS | MONSTER | EXIT | KURTZ
+ITEM_FLAGS = (FIRE, SPIKES, DARTS, MONSTER, EXIT, KURTZ)
+
+# Flags of every element label of the board
+ELEMENT_FLAGS = {
+    "|::::|": 0,
+    "|:F::|": FIRE,
+    "|:P::|": SPIKES,
+    "|:D::|": DARTS,
+    "|:FD:|": FIRE | DARTS,
+    "|:FP:|": FIRE | SPIKES,
+    "|:DP:|": DARTS | SPIKES,
+    "|FDP:|": FIRE | DARTS | SPIKES,
+    "|:S::|": EXIT,
+    "|:M::|": MONSTER,
+    "|:CK:|": KURTZ,
+    "|:SM:|": EXIT | MONSTER,
+    "|SCK:|": EXIT | KURTZ,
+    "|MCK:|": MONSTER | KURTZ,
+    "|SCKM|": EXIT | MONSTER | KURTZ,
+    "|:CW:|": CAPTAIN,
+    "|CWCK|": CAPTAIN | WITH_KURTZ,
+}
+
+
 class Palace:
     """
     Class that represents the game map (palace)
     """
 
-    def __init__(self, dimension):
+    def __init__(self, dimension, seed=None):
         # Constructor for Palace class
+        # A seed makes the random placement of the elements reproducible
         self.dimension = dimension
+        self.random = random.Random(seed)
 
         # Define different types of rooms with specific elements and colors
         self.base_cell = Room("|::::|", "", (0, 0))
         self.entry_cell = Room("|::::|", Fore.YELLOW, (0, 0))
         self.exit_cell = Room("|:S::|", Fore.GREEN, (0, 0))
         self.CW_cell = Room("|:CW:|", Fore.RED, (0, 0))
+        self.CW_CK_cell = Room("|CWCK|", Fore.LIGHTYELLOW_EX, (0, 0))
         self.D_cell = Room("|:D::|", Fore.MAGENTA, (0, 0))
         self.F_cell = Room("|:F::|", Fore.MAGENTA, (0, 0))
         self.P_cell = Room("|:P::|", Fore.MAGENTA, (0, 0))
@@ -62,89 +97,136 @@ class Palace:
         self.D_P_cell = Room("|:DP:|", Fore.MAGENTA, (0, 0))
         self.F_D_P_cell = Room("|FDP:|", Fore.MAGENTA, (0, 0))
 
-        # Initialize the game board with the base cell and generate the map
-        self.board = [[self.base_cell] * self.dimension for _ in range(self.dimension)]
+        # Room shown for every combination of flags
+        self.rooms = {0: self.base_cell}
+        for room in [
+            self.exit_cell,
+            self.CW_cell,
+            self.CW_CK_cell,
+            self.D_cell,
+            self.F_cell,
+            self.P_cell,
+            self.monster_cell,
+            self.CK_cell,
+            self.exit_monster_cell,
+            self.exit_ck_cell,
+            self.monster_ck_cell,
+            self.exit_monster_ck_cell,
+            self.F_D_cell,
+            self.F_P_cell,
+            self.D_P_cell,
+            self.F_D_P_cell,
+        ]:
+            self.rooms[ELEMENT_FLAGS[room.element]] = room
+
+        # Initialize the game board with one byte of flags per cell and generate the map
+        self.cells = np.zeros((self.dimension, self.dimension), dtype=np.uint8)
+
+        # Index of the positions of every item, and flags of the items adjacent
+        # to every cell (what Captain Willard perceives there)
+        self.item_positions = {flag: set() for flag in ITEM_FLAGS}
+        self.near = np.zeros((self.dimension, self.dimension), dtype=np.uint8)
+
+        # Counter bumped on every change of the board (keys the perception cache)
+        self.version = 0
 
         # Generate the map with entry, exit, and special elements
         self.generate_map()
 
     def generate_map(self):
         # Method to generate the game map by placing elements on the board
-        entry_x, entry_y = 0, 0
-        self.board[entry_x][entry_y] = self.entry_cell
+        # Hazards can go anywhere but the entry and the cells next to it
+        self.hazard_cells = [
+            (x, y)
+            for x in range(self.dimension)
+            for y in range(self.dimension)
+            if (x, y) not in [(0, 0), (1, 0), (0, 1)]
+        ]
 
-        self.board[0][0] = self.CW_cell
+        self.add_flags((0, 0), CAPTAIN)
 
         f_x, f_y = self.get_random_position()
-        self.board[f_x][f_y] = self.F_cell
+        self.add_flags((f_x, f_y), FIRE)
 
         d_x, d_y = self.get_random_position()
-        self.board[d_x][d_y] = self.D_cell
+        self.add_flags((d_x, d_y), DARTS)
 
         p_x, p_y = self.get_random_position()
-        self.board[p_x][p_y] = self.P_cell
-
-        if (f_x, f_y) == (d_x, d_y) and (f_x, f_y) == (p_x, p_y):
-            self.board[f_x][f_y] = self.F_D_P_cell
-
-        elif (f_x, f_y) == (d_x, d_y):
-            self.board[f_x][f_y] = self.F_D_cell
-
-        elif (f_x, f_y) == (p_x, p_y):
-            self.board[f_x][f_y] = self.F_P_cell
-
-        elif (d_x, d_y) == (p_x, p_y):
-            self.board[d_x][d_y] = self.D_P_cell
-
-        exit_x, exit_y = self.get_second_random_position()
-        self.board[exit_x][exit_y] = self.exit_cell
-
-        monster_x, monster_y = self.get_second_random_position()
-        self.board[monster_x][monster_y] = self.monster_cell
-
-        ck_x, ck_y = self.get_second_random_position()
-        self.board[ck_x][ck_y] = self.CK_cell
-
-        if (exit_x, exit_y) == (monster_x, monster_y) and (exit_x, exit_y) == (
-            ck_x,
-            ck_y,
-        ):
-            self.board[monster_x][monster_y] = self.exit_monster_ck_cell
-
-        elif (exit_x, exit_y) == (monster_x, monster_y):
-            self.board[monster_x][monster_y] = self.exit_monster_cell
-
-        elif (exit_x, exit_y) == (ck_x, ck_y):
-            self.board[exit_x][exit_y] = self.exit_ck_cell
+        self.add_flags((p_x, p_y), SPIKES)
+
+        # The exit, the monster and Kurtz go anywhere but the entry and the hazards
+        self.second_cells = [
+            (x, y)
+            for x in range(self.dimension)
+            for y in range(self.dimension)
+            if (x, y) != (0, 0) and (x, y) not in [(f_x, f_y), (d_x, d_y), (p_x, p_y)]
+        ]
 
-        elif (monster_x, monster_y) == (ck_x, ck_y):
-            self.board[monster_x][monster_y] = self.monster_ck_cell
+        self.add_flags(self.get_second_random_position(), EXIT)
+        self.add_flags(self.get_second_random_position(), MONSTER)
+        self.add_flags(self.get_second_random_position(), KURTZ)
 
     def get_random_position(self):
-        # Helper method to get a random position on the board
-        while True:
-            x, y = random.randint(0, self.dimension - 1), random.randint(
-                0, self.dimension - 1
-            )
-            if (x, y) != (0, 0) and (x, y) != (1, 0) and (x, y) != (0, 1):
-                return x, y
+        # Helper method to get a random position on the board for a hazard
+        return self.random.choice(self.hazard_cells)
 
     def get_second_random_position(self):
-        # Helper method to get a second random position on the board
-        while True:
-            x, y = random.randint(0, self.dimension - 1), random.randint(
-                0, self.dimension - 1
-            )
-            if (x, y) != (0, 0) and (
-                self.board[x][y] != self.F_D_cell
-                and self.board[x][y] != self.F_P_cell
-                and self.board[x][y] != self.D_P_cell
-                and self.board[x][y] != self.F_D_P_cell
-                and self.board[x][y] != self.F_cell
-                and self.board[x][y] != self.P_cell
-                and self.board[x][y] != self.D_cell
-            ):
-                return x, y
+        # Helper method to get a second random position on the board, away from the hazards
+        return self.random.choice(self.second_cells)
+
+    def neighbors(self, position):
+        # Cells orthogonally adjacent to a position inside the palace
+        x, y = position
+        return [
+            (i, j)
+            for i, j in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1))
+            if 0 <= i < self.dimension and 0 <= j < self.dimension
+        ]
+
+    def add_flags(self, position, flags):
+        # Put items (or Captain Willard) in a cell
+        x, y = position
+        self.cells[x, y] |= flags
+        for flag in ITEM_FLAGS:
+            if flags & flag:
+                self.item_positions[flag].add(position)
+                for cell in self.neighbors(position):
+                    self.near[cell] |= flag
+        self.version += 1
+
+    def remove_flags(self, position, flags):
+        # Take items (or Captain Willard) out of a cell
+        x, y = position
+        self.cells[x, y] &= ~flags & 0xFF
+        for flag in ITEM_FLAGS:
+            if flags & flag and position in self.item_positions[flag]:
+                self.item_positions[flag].discard(position)
+                for i, j in self.neighbors(position):
+                    # Keep the flag if another copy of the item is also adjacent
+                    if not any(
+                        abs(i - other_x) + abs(j - other_y) == 1
+                        for other_x, other_y in self.item_positions[flag]
+                    ):
+                        self.near[i, j] &= ~flag & 0xFF
+        self.version += 1
+
+    def room_at(self, position):
+        # Room shown in a cell, derived from its flags: Captain Willard hides
+        # what is under him and traps hide the other items
+        flags = int(self.cells[position])
+        if flags & CAPTAIN:
+            return self.rooms[flags & (CAPTAIN | WITH_KURTZ)]
+        if flags & TRAPS:
+            return self.rooms[flags & TRAPS]
+        return self.rooms[flags & ITEMS]
+
+    @property
+    def board(self):
+        # Board seen as a list of lists of rooms
+        return [
+            [self.room_at((x, y)) for y in range(self.dimension)]
+            for x in range(self.dimension)
+        ]
 
     def display_palace(self):
         # Print the current state of the palace board
@@ -152,56 +234,37 @@ class Palace:
             print("".join(str(room) for room in row))
 
     def find_element_position(self, element):
-        # Method to find the position of a specific element on the board
-        for x in range(self.dimension):
-            for y in range(self.dimension):
-                if self.board[x][y].element == element:
-                    return x, y
+        # Method to find the position of a specific element on the board: the
+        # first cell holding exactly those items (or that form of Captain Willard)
+        flags = ELEMENT_FLAGS[element]
+        mask = CAPTAIN | WITH_KURTZ if flags & CAPTAIN else ITEMS
+        cells = np.flatnonzero((self.cells & mask) == flags)
+        if cells.size:
+            return divmod(int(cells[0]), self.dimension)
+        return None
+
+    def find_flag_position(self, flag):
+        # First cell holding an item, alone or with others, using the index
+        positions = self.item_positions[flag]
+        if positions:
+            return min(positions)
         return None
 
     # Various methods to check the type of a room at a given position
     def is_precipice(self, position):
-        x, y = position
-        return (
-            self.board[x][y].element == "|:F::|"
-            or self.board[x][y].element == "|:FD:|"
-            or self.board[x][y].element == "|:DP:|"
-            or self.board[x][y].element == "|FDP:|"
-            or self.board[x][y].element == "|:FP:|"
-            or self.board[x][y].element == "|:P::|"
-            and self.board[x][y].element == "|:D::|"
-        )
+        return bool(self.cells[position] & TRAPS)
 
     def is_monster(self, position):
-        x, y = position
-        return (
-            self.board[x][y].element == "|:M::|"
-            or self.board[x][y].element == "|:SM:|"
-            or self.board[x][y].element == "|MCK:|"
-            or self.board[x][y].element == "|SCKM|"
-        )
+        return bool(self.cells[position] & MONSTER)
 
     def is_coronel(self, position):
-        x, y = position
-        return (
-            self.board[x][y].element == "|:CK:|"
-            or self.board[x][y].element == "|SCK:|"
-            or self.board[x][y].element == "|MCK:|"
-            or self.board[x][y].element == "|SCKM|"
-        )
+        return bool(self.cells[position] & KURTZ)
 
     def is_exit(self, position):
-        x, y = position
-        return (
-            self.board[x][y].element == "|:S::|"
-            or self.board[x][y].element == "|:SM:|"
-            or self.board[x][y].element == "|SCK:|"
-            or self.board[x][y].element == "|SCKM|"
-        )
+        return bool(self.cells[position] & EXIT)
 
     def is_secure(self, position):
-        x, y = position
-        return not (self.palace.is_monster() or self.palace.is_precipice())
+        return not self.cells[position] & (TRAPS | MONSTER)
 
 
 class CaptainWillard:
@@ -217,6 +280,12 @@ class CaptainWillard:
         self.kurtz_found = False
         self.explored_cells = []
 
+        # Counter bumped when Captain Willard moves; the perception is cached
+        # until this counter or the palace's one changes
+        self.version = 0
+        self.perception = None
+        self.perception_version = None
+
     # Captain Willard's actions: move, detonate, exit
 
     def move(self, direction):
@@ -225,44 +294,31 @@ class CaptainWillard:
 
         if self.is_valid_move(new_position):
             # Update explored cells and handle specific cases (precipice, monster, Kurtz)
+            self.version += 1
             self.explored_cells.append(self.position)
-            x, y = self.position
 
-            if (
-                self.palace.board[new_position[0]][new_position[1]]
-                == self.palace.base_cell
-            ):
-                (
-                    self.palace.board[x][y],
-                    self.palace.board[new_position[0]][new_position[1]],
-                ) = (self.palace.base_cell, self.palace.board[x][y])
+            # Captain Willard (with Kurtz, if he travels with him) leaves his cell
+            carried = self.palace.cells[self.position] & (CAPTAIN | WITH_KURTZ)
+            self.palace.remove_flags(self.position, carried)
+            self.palace.add_flags(new_position, carried)
 
-            else:
-                if self.palace.is_precipice(new_position):
-                    self.alive = False
-                    print(
-                        "¡Ahhh! Capitán Willard ha caído en un precipicio. Ha muerto."
-                    )
+            if self.palace.is_precipice(new_position):
+                self.alive = False
+                print("¡Ahhh! Capitán Willard ha caído en un precipicio. Ha muerto.")
 
-                elif self.palace.is_monster(new_position):
-                    self.alive = False
-                    print(
-                        "¡Ahhh! Capitán Willard ha sido devorado por el monstruo. Ha muerto."
-                    )
+            elif self.palace.is_monster(new_position):
+                self.alive = False
+                print(
+                    "¡Ahhh! Capitán Willard ha sido devorado por el monstruo. Ha muerto."
+                )
 
-                else:
-                    if self.palace.is_coronel(new_position):
-                        self.kurtz_found = True
-                        (
-                            self.palace.board[x][y],
-                            self.palace.board[new_position[0]][new_position[1]],
-                        ) = self.palace.base_cell, Room(
-                            "|CWCK|", Fore.LIGHTYELLOW_EX, (0, 0)
-                        )
-                        print(
-                            "Está en la misma celda que en Coronel Kurtz, ahora viaja junto a él."
-                        )
-                        
+            elif self.palace.is_coronel(new_position):
+                self.kurtz_found = True
+                self.palace.remove_flags(new_position, KURTZ)
+                self.palace.add_flags(new_position, WITH_KURTZ)
+                print(
+                    "Está en la misma celda que en Coronel Kurtz, ahora viaja junto a él."
+                )
 
             self.position = new_position
 
@@ -290,7 +346,7 @@ class CaptainWillard:
 
         dart = 1
         adjacent_cells = self.get_adjacent_cells()
-        monster_position = self.palace.find_element_position("|:M::|")
+        monster_position = self.palace.find_flag_position(MONSTER)
 
         if monster_position in adjacent_cells and dart > 0:
             print("¡Boom! El dardo ha tenido efecto y has derrotado al monstruo.")
@@ -309,15 +365,8 @@ class CaptainWillard:
             print("No tiene más dardos disponibles.")
 
     def defeat_monster(self, monster_position):
-        x, y = monster_position
-        if self.palace.board == "|:M::|":
-            self.palace.board[x][y] = self.palace.base_cell
-        elif [x][y].element == "|:SM:|":
-            self.palace.board[x][y] = self.palace.exit_cell
-        elif self.board[x][y].element == "|MCK:|":
-            self.palace.board[x][y] = self.palace.CK_cell
-        elif self.board[x][y].element == "|SCKM|":
-            self.palace.board[x][y] = self.palace.exit_ck_cell
+        # Remove the defeated monster, leaving the items that shared its cell
+        self.palace.remove_flags(monster_position, MONSTER)
 
     def get_adjacent_cells(self):
         x, y = self.position
@@ -341,53 +390,30 @@ class CaptainWillard:
     # Captain Willard's perceptions
 
     def get_perception(self):
-        adjacent_cells = self.get_adjacent_cells()
-
-        fire_positions = [
-            self.palace.find_element_position("|:F::|"),
-            self.palace.find_element_position("|:FD:|"),
-            self.palace.find_element_position("|:FP:|"),
-            self.palace.find_element_position("|FDP:|"),
-        ]
-        spikes_positions = [
-            self.palace.find_element_position("|:P::|"),
-            self.palace.find_element_position("|:FP:|"),
-            self.palace.find_element_position("|:DP:|"),
-            self.palace.find_element_position("|FDP:|"),
-        ]
-        darts_positions = [
-            self.palace.find_element_position("|:D::|"),
-            self.palace.find_element_position("|:FD:|"),
-            self.palace.find_element_position("|:DP:|"),
-            self.palace.find_element_position("|FDP:|"),
-        ]
-
-        monster_positions = [
-            self.palace.find_element_position("|:M::|"),
-            self.palace.find_element_position("|:SM:|"),
-            self.palace.find_element_position("|MCK:|"),
-            self.palace.find_element_position("|SCKM|"),
-        ]
-
-        exit_positions = [
-            self.palace.find_element_position("|:S::|"),
-            self.palace.find_element_position("|:SM:|"),
-            self.palace.find_element_position("|SCK:|"),
-            self.palace.find_element_position("|SCKM|"),
-        ]
-
-        fire = any(position in adjacent_cells for position in fire_positions)
-        spikes = any(position in adjacent_cells for position in spikes_positions)
-        darts = any(position in adjacent_cells for position in darts_positions)
-        smelly = any(position in adjacent_cells for position in monster_positions)
-        glowing = (
-            any(position in adjacent_cells for position in exit_positions)
-            or self.position in exit_positions
-        )
-        wall_up = self.position[0] == 0
-        wall_down = self.position[0] == self.palace.dimension - 1
-        wall_left = self.position[1] == 0
-        wall_right = self.position[1] == self.palace.dimension - 1
+        # Perceptions are computed again only if Captain Willard has moved or
+        # the board has changed
+        version = (self.version, self.palace.version)
+        if self.perception_version != version:
+            self.perception = self.calculate_perception()
+            self.perception_version = version
+        return list(self.perception)
+
+    def calculate_perception(self):
+        # Every perception is a bit of the flags of the items next to Captain
+        # Willard, which the palace keeps for every cell
+        x, y = self.position
+        near = int(self.palace.near[x, y])
+        here = int(self.palace.cells[x, y])
+
+        fire = bool(near & FIRE)
+        spikes = bool(near & SPIKES)
+        darts = bool(near & DARTS)
+        smelly = bool(near & MONSTER)
+        glowing = bool((near | here) & EXIT)
+        wall_up = x == 0
+        wall_down = x == self.palace.dimension - 1
+        wall_left = y == 0
+        wall_right = y == self.palace.dimension - 1
         shout = False
         found_kurtz = self.kurtz_found
 
@@ -406,199 +432,438 @@ class CaptainWillard:
         ]
 
 
+class BeliefEngine:
+    """
+    Class that represents independent beliefs about each of the five hazards as a single (5, n, n) array
+    """
+
+    # Hazards in the order of the first five perceptions: fire, spikes, darts,
+    # monster and exit
+    HAZARDS = ("F", "P", "D", "M", "S")
+
+    def __init__(self, dimension, error=0.0):
+        # Every hazard is in a single cell, with the prior Palace.generate_map
+        # gives it, and is updated only with its own perceptions: the way the
+        # hazards exclude each other is left to ParticleBeliefs. A perception is
+        # wrong with probability error (0 for the real game, where perceptions
+        # are exact)
+        self.dimension = dimension
+        self.size = dimension * dimension
+        self.error = error
+        if error > 0:
+            self.log_odds = math.log((1 - error) / error)
+
+        # Cells where every hazard can be: traps never go in the entry or next
+        # to it, the monster and the exit never go in the entry
+        self.allowed = np.ones((len(self.HAZARDS), dimension, dimension), dtype=bool)
+        self.allowed[:, 0, 0] = False
+        self.entry_adjacent = np.zeros((dimension, dimension), dtype=bool)
+        for x, y in ((1, 0), (0, 1)):
+            if x < dimension and y < dimension:
+                self.allowed[:3, x, y] = False
+                self.entry_adjacent[x, y] = True
+
+        # Prior weight of the two kinds of allowed cells (0: away from the
+        # entry, 1: next to it). Traps are uniform; the monster and the exit
+        # never share a cell with a trap, and no trap goes next to the entry
+        self.kinds = self.entry_adjacent.astype(np.int8)
+        self.kind_weights = [(1.0, 0.0)] * 3 + [self.second_prior(dimension)] * 2
+        self.prior = np.array(
+            [
+                np.where(allowed, np.choose(self.kinds, weights), 0.0)
+                for allowed, weights in zip(self.allowed, self.kind_weights)
+            ]
+        )
+
+        # Log-space accumulators: the log-likelihood of every cell is
+        # score * log_odds plus a constant shared by all the cells, so a
+        # perception only changes the scores of the cells it talks about.
+        # The histogram of (score, kind) of the allowed cells gives the normalizer
+        self.scores = np.zeros((len(self.HAZARDS), dimension, dimension), dtype=np.int32)
+        self.histograms = []
+        for allowed in self.allowed:
+            histogram = {}
+            for kind in np.unique(self.kinds[allowed]):
+                histogram[0, int(kind)] = int((allowed & (self.kinds == kind)).sum())
+            self.histograms.append(histogram)
+
+        # Cells already checked for every hazard and positions already perceived
+        self.visited = np.zeros((len(self.HAZARDS), dimension, dimension), dtype=bool)
+        self.observed = np.zeros((dimension, dimension), dtype=bool)
+
+        # Dense posterior of every hazard, rebuilt only when it is read after a change
+        self.beliefs = np.zeros((len(self.HAZARDS), dimension, dimension))
+        self.changed = True
+
+        # Flat indices of the neighbors of every cell, padded with -1
+        cells = np.arange(self.size)
+        x, y = np.divmod(cells, dimension)
+        self.neighbors = np.stack(
+            [
+                np.where(x > 0, cells - dimension, -1),
+                np.where(x < dimension - 1, cells + dimension, -1),
+                np.where(y > 0, cells - 1, -1),
+                np.where(y < dimension - 1, cells + 1, -1),
+            ],
+            axis=1,
+        )
+
+    @staticmethod
+    def second_prior(dimension):
+        # Relative prior of the monster (or the exit) in a cell away from the
+        # entry and in a cell next to it: the three traps are drawn with
+        # replacement among the m trap cells, and then the monster among the
+        # cells left but the entry. Trap draws are counted by distinct cells
+        size = dimension * dimension
+        m = size - 3
+        if m <= 0:
+            return 1.0, 1.0
+
+        def expected_share(cells):
+            # Sum over the trap draws among cells of 1 / cells left for the monster
+            draws = (
+                (1, cells),
+                (2, 3 * cells * (cells - 1)),
+                (3, cells * (cells - 1) * (cells - 2)),
+            )
+            return sum(number / (size - 1 - distinct) for distinct, number in draws if number)
+
+        return expected_share(m - 1) / m**3, expected_share(m) / m**3
+
+    def adjacent(self, position):
+        # Flat indices of the cells adjacent to a position
+        row = self.neighbors[position[0] * self.dimension + position[1]]
+        return row[row >= 0]
+
+    def update(self, position, perception):
+        # Multiply in the likelihood of the perception at a position. Perceptions
+        # never change in the same cell, so only the first one in each cell counts
+        x, y = position
+        if self.observed[x, y]:
+            return
+        self.observed[x, y] = True
+
+        adjacent = [divmod(int(cell), self.dimension) for cell in self.adjacent(position)]
+        for hazard in range(len(self.HAZARDS)):
+            # The exit also glows in the cell where it is
+            cells = adjacent + [position] if self.HAZARDS[hazard] == "S" else adjacent
+            step = 1 if perception[hazard] else -1
+            scores = self.scores[hazard]
+            allowed = self.allowed[hazard]
+            histogram = self.histograms[hazard]
+            for i, j in cells:
+                self.visited[hazard, i, j] = True
+                score = int(scores[i, j])
+                scores[i, j] = score + step
+                if allowed[i, j]:
+                    kind = int(self.kinds[i, j])
+                    histogram[score, kind] -= 1
+                    if not histogram[score, kind]:
+                        del histogram[score, kind]
+                    histogram[score + step, kind] = histogram.get((score + step, kind), 0) + 1
+        self.changed = True
+
+    def log_normalizer(self, hazard):
+        # Highest score and log of the sum of the weights relative to it
+        histogram = self.histograms[hazard]
+        weights = self.kind_weights[hazard]
+        best = max(score for score, _ in histogram)
+        if self.error == 0:
+            return best, math.log(
+                sum(
+                    count * weights[kind]
+                    for (score, kind), count in histogram.items()
+                    if score == best
+                )
+            )
+        return best, math.log(
+            sum(
+                count * weights[kind] * math.exp(self.log_odds * (score - best))
+                for (score, kind), count in histogram.items()
+            )
+        )
+
+    def probability(self, hazard, position):
+        # Posterior probability of a hazard in one cell
+        x, y = position
+        if not self.allowed[hazard, x, y]:
+            return 0.0
+        best, log_total = self.log_normalizer(hazard)
+        score = int(self.scores[hazard, x, y])
+        prior = self.prior[hazard, x, y]
+        if self.error == 0:
+            return prior * math.exp(-log_total) if score == best else 0.0
+        return prior * math.exp(self.log_odds * (score - best) - log_total)
+
+    def posteriors(self):
+        # Dense posterior of every hazard, in one vectorized pass
+        if self.changed:
+            normalizers = [self.log_normalizer(h) for h in range(len(self.HAZARDS))]
+            best = np.array([b for b, _ in normalizers])[:, None, None]
+            log_total = np.array([t for _, t in normalizers])[:, None, None]
+            if self.error == 0:
+                weights = self.scores == best
+            else:
+                weights = np.exp(self.log_odds * (self.scores - best))
+            self.beliefs = self.prior * weights * np.exp(-log_total)
+            self.changed = False
+        return self.beliefs
+
+
+class ParticleBeliefs:
+    """
+    Class that represents the beliefs about the five hazards as a set of weighted particles
+    """
+
+    HAZARDS = BeliefEngine.HAZARDS
+
+    # A perception that no particle explains would leave every weight at zero,
+    # so perceptions are always taken as slightly unreliable
+    MIN_ERROR = 1e-3
+
+    def __init__(self, dimension, particles=10000, error=0.0, seed=None):
+        # Every particle is a full map: the cells of the fire, spikes and darts
+        # traps, the monster and the exit, drawn as Palace.generate_map does
+        self.dimension = dimension
+        self.size = dimension * dimension
+        self.count = particles
+        self.error = max(error, self.MIN_ERROR)
+        self.log_right = math.log(1 - self.error)
+        self.log_wrong = math.log(self.error)
+        self.log_odds = self.log_right - self.log_wrong
+        self.random = np.random.default_rng(seed)
+
+        # Cells where the traps can go, and where the monster and the exit can go
+        self.hazard_cells = np.array(
+            [
+                cell
+                for cell in range(self.size)
+                if divmod(cell, dimension) not in [(0, 0), (1, 0), (0, 1)]
+            ]
+        )
+        self.other_cells = np.arange(1, self.size)
+
+        self.particles = self.sample_prior(particles)
+        self.log_weights = np.zeros(particles)
+
+        # Score of every hazard in every cell as in BeliefEngine: the
+        # log-likelihood of the evidence is score * log_odds plus a constant
+        self.scores = np.zeros((len(self.HAZARDS), self.size), dtype=np.int32)
+        self.visited = np.zeros((len(self.HAZARDS), dimension, dimension), dtype=bool)
+        self.observed = np.zeros((dimension, dimension), dtype=bool)
+        self.beliefs = None
+        self.changed = True
+
+    def sample_prior(self, count):
+        # Draw count maps; returns an int16 array of shape (count, 5, 2)
+        n = self.dimension
+        traps = self.random.choice(self.hazard_cells, size=(count, 3))
+
+        # The monster and the exit go in any cell but the entry and the traps:
+        # the r-th of those cells is found skipping the excluded ones in order
+        excluded = np.sort(np.column_stack((np.zeros(count, dtype=np.int64), traps)), axis=1)
+        repeated = np.zeros(excluded.shape, dtype=bool)
+        repeated[:, 1:] = excluded[:, 1:] == excluded[:, :-1]
+        excluded[repeated] = self.size
+        excluded.sort(axis=1)
+        free = self.free_cells(traps)
+
+        others = []
+        for _ in ("M", "S"):
+            cell = (self.random.random(count) * free).astype(np.int64)
+            for column in range(excluded.shape[1]):
+                cell += cell >= excluded[:, column]
+            others.append(cell)
+
+        cells = np.column_stack([traps] + others)
+        return np.stack(np.divmod(cells, n), axis=2).astype(np.int16)
+
+    def free_cells(self, traps):
+        # Number of cells left for the monster and the exit next to some traps
+        distinct = 1 + (traps[:, 1] != traps[:, 0])
+        distinct += (traps[:, 2] != traps[:, 0]) & (traps[:, 2] != traps[:, 1])
+        return self.size - 1 - distinct
+
+    def weights(self):
+        # Normalized weights of the particles
+        weights = np.exp(self.log_weights - self.log_weights.max())
+        return weights / weights.sum()
+
+    def update(self, position, perception):
+        # Weight every particle by the likelihood of the perception at a position
+        # and resample them when too few particles carry the weight
+        x, y = position
+        if self.observed[x, y]:
+            return
+        self.observed[x, y] = True
+
+        for i, j in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1), (x, y)):
+            if 0 <= i < self.dimension and 0 <= j < self.dimension:
+                # The exit also glows in the cell where it is
+                hazards = range(len(self.HAZARDS)) if (i, j) != (x, y) else [4]
+                for hazard in hazards:
+                    self.visited[hazard, i, j] = True
+                    self.scores[hazard, i * self.dimension + j] += (
+                        1 if perception[hazard] else -1
+                    )
+
+        distances = np.abs(self.particles[:, :, 0] - x) + np.abs(self.particles[:, :, 1] - y)
+        perceived = distances == 1
+        perceived[:, 4] |= distances[:, 4] == 0
+        right = perceived == np.asarray(perception[: len(self.HAZARDS)], dtype=bool)
+        self.log_weights += np.where(right, self.log_right, self.log_wrong).sum(axis=1)
+
+        weights = self.weights()
+        if 1 / np.square(weights).sum() < self.count / 2:
+            self.resample(weights)
+        self.changed = True
+
+    def resample(self, weights):
+        # Systematic resampling: one random offset and count evenly spaced picks
+        positions = (self.random.random() + np.arange(self.count)) / self.count
+        cumulative = np.cumsum(weights)
+        cumulative[-1] = 1.0
+        self.particles = self.particles[np.searchsorted(cumulative, positions)]
+        self.log_weights = np.zeros(self.count)
+        self.rejuvenate()
+
+    def rejuvenate(self):
+        # One Metropolis-Hastings sweep over the hazards of every particle, so
+        # that the copies made by resampling spread again over the cells the
+        # evidence allows; the scores give the likelihood ratio of every move
+        cells = self.particles[:, :, 0].astype(np.int64) * self.dimension
+        cells += self.particles[:, :, 1]
+        for hazard in range(len(self.HAZARDS)):
+            candidates = self.hazard_cells if hazard < 3 else self.other_cells
+            proposal = candidates[self.random.integers(len(candidates), size=self.count)]
+            scores = self.scores[hazard]
+            log_ratio = self.log_odds * (scores[proposal] - scores[cells[:, hazard]])
+            if hazard < 3:
+                # A trap cannot go under the monster or the exit, and moving it
+                # changes how many cells the monster and the exit can take
+                valid = (proposal != cells[:, 3]) & (proposal != cells[:, 4])
+                traps = cells[:, :3].copy()
+                traps[:, hazard] = proposal
+                log_ratio += 2 * (
+                    np.log(self.free_cells(cells[:, :3])) - np.log(self.free_cells(traps))
+                )
+            else:
+                valid = (proposal[:, None] != cells[:, :3]).all(axis=1)
+            accept = valid & (np.log(self.random.random(self.count)) < log_ratio)
+            cells[accept, hazard] = proposal[accept]
+        self.particles = np.stack(np.divmod(cells, self.dimension), axis=2).astype(np.int16)
+
+    def posteriors(self):
+        # Weighted share of particles with every hazard in every cell, in one pass
+        if self.changed:
+            cells = self.particles[:, :, 0].astype(np.int64) * self.dimension
+            cells += self.particles[:, :, 1]
+            cells += np.arange(len(self.HAZARDS)) * self.size
+            counts = np.bincount(
+                cells.ravel(),
+                weights=np.repeat(self.weights(), len(self.HAZARDS)),
+                minlength=len(self.HAZARDS) * self.size,
+            )
+            self.beliefs = counts.reshape(len(self.HAZARDS), self.dimension, self.dimension)
+            self.changed = False
+        return self.beliefs
+
+    def probability(self, hazard, position):
+        # Posterior probability of a hazard in one cell
+        return float(self.posteriors()[hazard][position])
+
+
 class BayesianLogicAgent:
     """
     Class that represents a bayesian knowledge-based agent
     """
 
-    def __init__(self, palace, capitan):
+    def __init__(self, palace, capitan, error=0.0, particles=None, seed=None):
         self.palace = palace
         self.capitan = capitan
-        self.F_matrix = [
-            [None] * self.palace.dimension for _ in range(self.palace.dimension)
-        ]
-        self.P_matrix = [
-            [None] * self.palace.dimension for _ in range(self.palace.dimension)
-        ]
-        self.D_matrix = [
-            [None] * self.palace.dimension for _ in range(self.palace.dimension)
-        ]
-        self.M_matrix = [
-            [None] * self.palace.dimension for _ in range(self.palace.dimension)
-        ]
-        self.S_matrix = [
-            [None] * self.palace.dimension for _ in range(self.palace.dimension)
-        ]
 
-        self.F_visited_cells = set()
-        self.P_visited_cells = set()
-        self.D_visited_cells = set()
-        self.M_visited_cells = set()
-        self.S_visited_cells = set()
+        # Beliefs about every hazard, updated once per state of Captain Willard:
+        # independent for every hazard by default, or a particle filter with the
+        # given number of particles (faster on big palaces, and aware of how
+        # hazards interact)
+        if particles:
+            self.engine = ParticleBeliefs(self.palace.dimension, particles, error, seed)
+        else:
+            self.engine = BeliefEngine(self.palace.dimension, error)
+        self.engine_version = None
 
-    def posterior_F(self):
-        # Method to calculate the posterior distribution for the fire trap
-        percepts = self.capitan.get_perception()
-        adjacent_cells = self.capitan.get_adjacent_cells()
-        self.F_visited_cells.update(adjacent_cells)
-
-        if percepts[0]:
-            percept = True
-            adjacent_null_cells = []
-            adjacent_non_null_cells = []
-            for cell in adjacent_cells:
-                x, y = cell[0], cell[1]
-                if self.F_matrix[x][y] == 0.00:
-                    adjacent_null_cells.append(cell)
-                else:
-                    adjacent_non_null_cells.append(cell)
-            for x, row in enumerate(self.palace.board):
-                for y, room in enumerate(row):
-                    self.F_matrix[x][y] = 0.00
-            for cell in adjacent_non_null_cells:
-                x, y = cell[0], cell[1]
-                self.F_matrix[x][y] = 1 / len(adjacent_non_null_cells)
+    def update_beliefs(self):
+        # Update the belief engine if Captain Willard has moved or the board has changed
+        version = (self.capitan.version, self.palace.version)
+        if self.engine_version != version:
+            self.engine.update(self.capitan.position, self.capitan.get_perception())
+            self.engine_version = version
+        return self.engine.posteriors()
 
-        else:
-            for x, row in enumerate(self.palace.board):
-                for y, room in enumerate(row):
-                    if (x, y) in self.F_visited_cells:
-                        self.F_matrix[x][y] = 0.0
-                    else:
-                        self.F_matrix[x][y] = 1 / (
-                            (self.palace.dimension) ** 2 - len(self.F_visited_cells)
-                        )
+    def visited_cells(self, hazard):
+        # Cells already checked for a hazard
+        return {
+            tuple(cell) for cell in np.argwhere(self.engine.visited[hazard]).tolist()
+        }
+
+    # Per-hazard matrices and checked cells, as views over the belief engine
+
+    @property
+    def F_matrix(self):
+        return self.engine.posteriors()[0]
+
+    @property
+    def P_matrix(self):
+        return self.engine.posteriors()[1]
+
+    @property
+    def D_matrix(self):
+        return self.engine.posteriors()[2]
+
+    @property
+    def M_matrix(self):
+        return self.engine.posteriors()[3]
+
+    @property
+    def S_matrix(self):
+        return self.engine.posteriors()[4]
+
+    @property
+    def F_visited_cells(self):
+        return self.visited_cells(0)
+
+    @property
+    def P_visited_cells(self):
+        return self.visited_cells(1)
 
-        return self.F_matrix
+    @property
+    def D_visited_cells(self):
+        return self.visited_cells(2)
+
+    @property
+    def M_visited_cells(self):
+        return self.visited_cells(3)
+
+    @property
+    def S_visited_cells(self):
+        return self.visited_cells(4)
+
+    def posterior_F(self):
+        # Method to calculate the posterior distribution for the fire trap
+        return self.update_beliefs()[0]
 
     # Methods for calculating posterior distributions for other traps and entities
     def posterior_P(self):
-        percepts = self.capitan.get_perception()
-        adjacent_cells = self.capitan.get_adjacent_cells()
-        self.P_visited_cells.update(adjacent_cells)
-
-        if percepts[1]:
-            adjacent_null_cells = []
-            adjacent_non_null_cells = []
-            for cell in adjacent_cells:
-                x, y = cell[0], cell[1]
-                if self.P_matrix[x][y] == 0.00:
-                    adjacent_null_cells.append(cell)
-                else:
-                    adjacent_non_null_cells.append(cell)
-            for x, row in enumerate(self.palace.board):
-                for y, room in enumerate(row):
-                    self.P_matrix[x][y] = 0.00
-            for cell in adjacent_non_null_cells:
-                x, y = cell[0], cell[1]
-                self.P_matrix[x][y] = 1 / len(adjacent_non_null_cells)
-        else:
-            for x, row in enumerate(self.palace.board):
-                for y, room in enumerate(row):
-                    if (x, y) in self.F_visited_cells:
-                        self.P_matrix[x][y] = 0.0
-                    else:
-                        self.P_matrix[x][y] = 1 / (
-                            (self.palace.dimension) ** 2 - len(self.P_visited_cells)
-                        )
-
-        return self.P_matrix
+        return self.update_beliefs()[1]
 
     def posterior_D(self):
-        percepts = self.capitan.get_perception()
-        adjacent_cells = self.capitan.get_adjacent_cells()
-        self.D_visited_cells.update(adjacent_cells)
-
-        if percepts[2]:
-            adjacent_null_cells = []
-            adjacent_non_null_cells = []
-            for cell in adjacent_cells:
-                x, y = cell[0], cell[1]
-                if self.D_matrix[x][y] == 0.00:
-                    adjacent_null_cells.append(cell)
-                else:
-                    adjacent_non_null_cells.append(cell)
-            for x, row in enumerate(self.palace.board):
-                for y, room in enumerate(row):
-                    self.D_matrix[x][y] = 0.00
-            for cell in adjacent_non_null_cells:
-                x, y = cell[0], cell[1]
-                self.D_matrix[x][y] = 1 / len(adjacent_non_null_cells)
-        else:
-            for x, row in enumerate(self.palace.board):
-                for y, room in enumerate(row):
-                    if (x, y) in self.F_visited_cells:
-                        self.D_matrix[x][y] = 0.0
-                    else:
-                        self.D_matrix[x][y] = 1 / (
-                            (self.palace.dimension) ** 2 - len(self.D_visited_cells)
-                        )
-
-        return self.D_matrix
+        return self.update_beliefs()[2]
 
     def posterior_M(self):
-        percepts = self.capitan.get_perception()
-        adjacent_cells = self.capitan.get_adjacent_cells()
-        self.M_visited_cells.update(adjacent_cells)
-
-        if percepts[3]:
-            adjacent_null_cells = []
-            adjacent_non_null_cells = []
-            for cell in adjacent_cells:
-                x, y = cell[0], cell[1]
-                if self.M_matrix[x][y] == 0.00:
-                    adjacent_null_cells.append(cell)
-                else:
-                    adjacent_non_null_cells.append(cell)
-            for x, row in enumerate(self.palace.board):
-                for y, room in enumerate(row):
-                    self.M_matrix[x][y] = 0.00
-            for cell in adjacent_non_null_cells:
-                x, y = cell[0], cell[1]
-                self.M_matrix[x][y] = 1 / len(adjacent_non_null_cells)
-        else:
-            for x, row in enumerate(self.palace.board):
-                for y, room in enumerate(row):
-                    if (x, y) in self.F_visited_cells:
-                        self.M_matrix[x][y] = 0.0
-                    else:
-                        self.M_matrix[x][y] = 1 / (
-                            (self.palace.dimension) ** 2 - len(self.M_visited_cells)
-                        )
-
-        return self.M_matrix
+        return self.update_beliefs()[3]
 
     def posterior_S(self):
-        percepts = self.capitan.get_perception()
-        adjacent_cells = self.capitan.get_adjacent_cells()
-        self.S_visited_cells.update(adjacent_cells)
-
-        if percepts[4]:
-            adjacent_null_cells = []
-            adjacent_non_null_cells = []
-            for cell in adjacent_cells:
-                x, y = cell[0], cell[1]
-                if self.S_matrix[x][y] == 0.00:
-                    adjacent_null_cells.append(cell)
-                else:
-                    adjacent_non_null_cells.append(cell)
-            for x, row in enumerate(self.palace.board):
-                for y, room in enumerate(row):
-                    self.S_matrix[x][y] = 0.00
-            for cell in adjacent_non_null_cells:
-                x, y = cell[0], cell[1]
-                self.S_matrix[x][y] = 1 / len(adjacent_non_null_cells)
-        else:
-            for x, row in enumerate(self.palace.board):
-                for y, room in enumerate(row):
-                    if (x, y) in self.F_visited_cells:
-                        self.S_matrix[x][y] = 0.0
-                    else:
-                        self.S_matrix[x][y] = 1 / (
-                            (self.palace.dimension) ** 2 - len(self.S_visited_cells)
-                        )
-
-        return self.S_matrix
+        return self.update_beliefs()[4]
 
     # Method to display the posterior distributions for different elements
     def display_palace_prob(self, element, position, perception, captain_position):
@@ -12,12 +12,23 @@ Definición de las clases usadas en el agente buscador.
 
 # Import necessary modules
 
+import heapq
+import math
 import random
+import sys
+import weakref
+from array import array
+from collections import deque
+from functools import partial
+
+import numpy as np
 
 class Node:
     """
     Class that represents a state in the search space
     """
+    __slots__ = ("state", "parent", "action", "cost")
+
     def __init__(self, state, parent=None, action=None, cost=0):
         self.state = state
         self.parent = parent
@@ -28,55 +39,388 @@ class Node:
         return f"Estado: {self.state} Acción: {self.action}\n"
 
 
+def manhattan(state, goal):
+    # Manhattan distance between two cells of the grid
+    return abs(state[0] - goal[0]) + abs(state[1] - goal[1])
+
+
+def octile(state, goal):
+    # Octile distance between two cells of the grid
+    dx = abs(state[0] - goal[0])
+    dy = abs(state[1] - goal[1])
+    return max(dx, dy) + (math.sqrt(2) - 1) * min(dx, dy)
+
+
+# Action that undoes each movement, used to join paths found backwards
+OPPOSITE_ACTIONS = {
+    "arriba": "abajo",
+    "abajo": "arriba",
+    "izquierda": "derecha",
+    "derecha": "izquierda",
+}
+
+
+# Movements of the agent, stored in the search node store by their position
+ACTIONS = ("arriba", "abajo", "izquierda", "derecha")
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+
+def nodes_from_path(path):
+    # Chain a list of (state, action) pairs into Nodes and return the last one
+    current_node = None
+    for cost, (state, action) in enumerate(path):
+        current_node = Node(state=state, parent=current_node, action=action, cost=cost)
+    return current_node
+
+
+class SearchNodeStore:
+    """
+    Class that keeps the search tree in flat arrays indexed by state
+    """
+    def __init__(self, size):
+        # parent[state] is -1 until the state is reached; a root is its own parent
+        self.parent = array("i", [-1]) * size
+        self.action = bytearray(size)
+        self.cost = array("i", [0]) * size
+
+    def add_root(self, state):
+        # Register the state where a search starts
+        self.parent[state] = state
+        self.cost[state] = 0
+
+    def add(self, state, parent, action, cost):
+        # Register (or improve) the way a state is reached
+        self.parent[state] = parent
+        self.action[state] = ACTION_CODES[action]
+        self.cost[state] = cost
+
+    def reached(self, state):
+        # Check if a state has already been reached by the search
+        return self.parent[state] >= 0
+
+    def path(self, state):
+        # (state, action) pairs from the root to a state, built in linear time
+        path = []
+        while self.parent[state] != state:
+            path.append((state, ACTIONS[self.action[state]]))
+            state = self.parent[state]
+        path.append((state, None))
+        path.reverse()
+        return path
+
+    def node(self, state):
+        # Build the Node chain from the root to a state
+        return nodes_from_path(self.path(state))
+
+
+# Byte codes stored in each cell of the compact grid and their labels
+EMPTY, CW, CK, OBSTACLE = 0, 1, 2, 3
+CELL_CODES = {" ": EMPTY, "CW": CW, "CK": CK, "XX": OBSTACLE}
+CELL_LABELS = {code: label for label, code in CELL_CODES.items()}
+CELL_DRAWINGS = {EMPTY: "|::::|", CW: "|:CW:|", CK: "|:CK:|", OBSTACLE: "|:XX:|"}
+
+
+class CompactGrid:
+    """
+    Class that represents a square grid stored with one byte per cell
+    """
+    def __init__(self, dimension):
+        # Cells are addressed by flat indices: index = row * dimension + col
+        self.dimension = dimension
+        self.size = dimension * dimension
+        self.cells = bytearray(self.size)
+
+    def index(self, position):
+        # Convert a (row, col) position into a flat index
+        return position[0] * self.dimension + position[1]
+
+    def position(self, index):
+        # Convert a flat index into a (row, col) position
+        return divmod(index, self.dimension)
+
+    def is_blocked(self, index):
+        # Check if a cell is an obstacle
+        return self.cells[index] == OBSTACLE
+
+    def neighbors(self, index):
+        # Get the movements that stay inside the grid and do not enter an
+        # obstacle, and the cells they reach
+        dimension = self.dimension
+        cells = self.cells
+        col = index % dimension
+        neighbors = []
+        if index >= dimension and cells[index - dimension] != OBSTACLE:
+            neighbors.append(("arriba", index - dimension))
+        if index < self.size - dimension and cells[index + dimension] != OBSTACLE:
+            neighbors.append(("abajo", index + dimension))
+        if col > 0 and cells[index - 1] != OBSTACLE:
+            neighbors.append(("izquierda", index - 1))
+        if col < dimension - 1 and cells[index + 1] != OBSTACLE:
+            neighbors.append(("derecha", index + 1))
+        return neighbors
+
+
+class GridRow:
+    """
+    Class that exposes a row of the compact grid as a list of labels
+    """
+    def __init__(self, environment, row):
+        self.environment = environment
+        self.grid = environment.grid
+        self.row = row
+        self.offset = row * self.grid.dimension
+
+    def __len__(self):
+        return self.grid.dimension
+
+    def __getitem__(self, col):
+        if not 0 <= col < self.grid.dimension:
+            raise IndexError("column out of range")
+        return CELL_LABELS[self.grid.cells[self.offset + col]]
+
+    def __setitem__(self, col, label):
+        # Obstacles are placed and removed through the environment, so that its
+        # distance field and its observers are told about the change
+        if not 0 <= col < self.grid.dimension:
+            raise IndexError("column out of range")
+        index = self.offset + col
+        code = CELL_CODES[label]
+        if code == OBSTACLE and self.grid.cells[index] != OBSTACLE:
+            self.grid.cells[index] = EMPTY
+            self.environment.colocar_obstaculo((self.row, col))
+        elif code != OBSTACLE and self.grid.cells[index] == OBSTACLE:
+            self.environment.quitar_obstaculo((self.row, col))
+            self.grid.cells[index] = code
+        else:
+            self.grid.cells[index] = code
+
+    def __iter__(self):
+        for col in range(self.grid.dimension):
+            yield self[col]
+
+
+class GridBoard:
+    """
+    Class that exposes the compact grid with the old list of lists interface
+    """
+    def __init__(self, environment):
+        self.environment = environment
+        self.grid = environment.grid
+
+    def __len__(self):
+        return self.grid.dimension
+
+    def __getitem__(self, row):
+        if not 0 <= row < self.grid.dimension:
+            raise IndexError("row out of range")
+        return GridRow(self.environment, row)
+
+    def __iter__(self):
+        for row in range(self.grid.dimension):
+            yield GridRow(self.environment, row)
+
+
 class Environment:
     """
     Class that represents the 2D grid where the agent moves
     """
-    def __init__(self, dimension=6):
-        # Initialize the environment with a given dimension
+    def __init__(self, dimension=6, obstaculos=0, semilla=None, objetivo=None):
+        # Initialize the environment with a given dimension and number of obstacles
+        # A seed makes the random placement reproducible; a goal can also be fixed
         self.dimension = dimension
-        self.tablero = [[" "] * dimension for _ in range(dimension)]
+        self.random = random.Random(semilla)
+        self.grid = CompactGrid(dimension)
         self.start = (0, 0)
         self.goal = (0, 0)
         self.cw = None
-        self.colocar_elementos()
+        # Distances to the goal, computed on demand and cached for that goal,
+        # and the cells the reverse BFS expanded to compute them
+        self.campo = None
+        self.campo_objetivo = None
+        self.expansiones_campo = 0
+        # Functions called as observador(evento, indice) when a cell changes
+        self.observadores = []
+        self.colocar_elementos(objetivo)
+        self.colocar_obstaculos(obstaculos)
+
+    @classmethod
+    def importar(cls, datos):
+        # Rebuild an environment from the data produced by exportar()
+        entorno = cls(datos["dimension"], objetivo=tuple(datos["objetivo"]))
+        for posicion in datos["obstaculos"]:
+            entorno.colocar_obstaculo(tuple(posicion))
+        return entorno
+
+    def exportar(self):
+        # Describe the environment as plain data (dimension, goal and obstacles)
+        obstaculos = [
+            list(self.grid.position(indice))
+            for indice, celda in enumerate(self.grid.cells)
+            if celda == OBSTACLE
+        ]
+        return {
+            "dimension": self.dimension,
+            "objetivo": list(self.goal),
+            "obstaculos": obstaculos,
+        }
 
-    def colocar_elementos(self):
-        # Place the goal and agent (CW) in random positions on the grid
-        self.goal = self.generar_posicion_aleatoria()
+    def colocar_elementos(self, objetivo=None):
+        # Place the agent (CW) at the start and the goal in a random (or given) position
+        self.goal = objetivo or self.generar_posicion_aleatoria()
         self.start = (0, 0)
         while self.start == self.goal:
             self.goal = self.generar_posicion_aleatoria()
         self.cw = self.start
-        self.tablero[self.start[0]][self.start[1]] = "CW"
-        self.tablero[self.goal[0]][self.goal[1]] = "CK"
+        self.grid.cells[self.grid.index(self.start)] = CW
+        self.grid.cells[self.grid.index(self.goal)] = CK
+        self.invalidar_campo_distancias()
+
+    @property
+    def tablero(self):
+        # Board seen as a list of lists of labels (" ", "CW", "CK", "XX")
+        return GridBoard(self)
 
     def generar_posicion_aleatoria(self):
         # Generate a random position within the grid
-        return random.randint(0, self.dimension - 1), random.randint(
+        return self.random.randint(0, self.dimension - 1), self.random.randint(
             0, self.dimension - 1
         )
 
-    def imprimir(self, solution=None, frontier=None, explored=None):
-        # Print the current state of the environment
-        print("Situación del palacio:")
-        for i, row in enumerate(self.tablero):
-            for j, col in enumerate(row):
-                if col == "CK":
-                    print("|:CK:|", end="")
-                elif col == "CW":
-                    print("|:CW:|", end="")
-                else:
-                    print("|::::|", end="")
-            print()
-        print()
+    def colocar_obstaculos(self, cantidad):
+        # Block a number of random free cells (never the agent or the goal)
+        cantidad = min(cantidad, self.grid.cells.count(EMPTY))
+        for _ in range(cantidad):
+            posicion = self.generar_posicion_aleatoria()
+            while self.grid.cells[self.grid.index(posicion)] != EMPTY:
+                posicion = self.generar_posicion_aleatoria()
+            self.colocar_obstaculo(posicion)
+
+    def colocar_obstaculo(self, posicion):
+        # Turn a free cell into an obstacle
+        indice = self.grid.index(posicion)
+        if self.grid.cells[indice] != EMPTY:
+            return False
+        self.grid.cells[indice] = OBSTACLE
+        self.invalidar_campo_distancias()
+        self.notificar("obstaculo", indice)
+        return True
+
+    def quitar_obstaculo(self, posicion):
+        # Turn an obstacle back into a free cell
+        indice = self.grid.index(posicion)
+        if self.grid.cells[indice] != OBSTACLE:
+            return False
+        self.grid.cells[indice] = EMPTY
+        self.invalidar_campo_distancias()
+        self.notificar("libre", indice)
+        return True
+
+    def suscribir(self, observador):
+        # Register a function to be told about obstacle changes and CW moves
+        # Methods are held by weak reference, so an agent that subscribes one
+        # is not kept alive (and notified) by the environment after it is gone
+        if hasattr(observador, "__self__"):
+            self.observadores.append(weakref.WeakMethod(observador))
+        else:
+            self.observadores.append(lambda: observador)
+
+    def desuscribir(self, observador):
+        # Stop telling a function about the changes of the environment
+        self.observadores = [
+            referencia
+            for referencia in self.observadores
+            if referencia() is not None and referencia() != observador
+        ]
+
+    def notificar(self, evento, indice):
+        # Tell every observer that a cell of the environment has changed,
+        # forgetting the ones that no longer exist
+        vivos = []
+        for referencia in self.observadores:
+            observador = referencia()
+            if observador is not None:
+                observador(evento, indice)
+                vivos.append(referencia)
+        self.observadores = vivos
+
+    def invalidar_campo_distancias(self):
+        # Discard the cached distance field so it is rebuilt on the next query
+        self.campo = None
+        self.campo_objetivo = None
+
+    def campo_calculado(self):
+        # Check if the distance field of the current goal is already cached
+        return self.campo is not None and self.campo_objetivo == self.goal
+
+    def campo_distancias(self):
+        # Distance from every cell to the goal, computed once with a reverse BFS
+        # Unreachable cells keep the value -1
+        if self.campo_calculado():
+            return self.campo
+
+        campo = array("i", [-1]) * self.grid.size
+        objetivo = self.grid.index(self.goal)
+        campo[objetivo] = 0
+        cola = deque([objetivo])
+        self.expansiones_campo = 0
+        while cola:
+            actual = cola.popleft()
+            self.expansiones_campo += 1
+            distancia = campo[actual] + 1
+            for _, vecino in self.grid.neighbors(actual):
+                if campo[vecino] < 0:
+                    campo[vecino] = distancia
+                    cola.append(vecino)
+
+        self.campo = campo
+        self.campo_objetivo = self.goal
+        return campo
+
+    def distancia_al_objetivo(self, posicion):
+        # Length of the shortest path from a position to the goal (None if unreachable)
+        distancia = self.campo_distancias()[self.grid.index(posicion)]
+        return distancia if distancia >= 0 else None
+
+    def pasos_hacia_objetivo(self, posicion):
+        # Shortest path from a position to the goal as a list of (action, index)
+        # moves, following the distance field downhill in O(path length)
+        campo = self.campo_distancias()
+        actual = self.grid.index(posicion)
+        distancia = campo[actual]
+        if distancia < 0:
+            return None
+
+        pasos = []
+        while distancia > 0:
+            for accion, vecino in self.grid.neighbors(actual):
+                if campo[vecino] == distancia - 1:
+                    pasos.append((accion, vecino))
+                    actual = vecino
+                    distancia -= 1
+                    break
+        return pasos
+
+    def renderizar(self):
+        # Build the whole frame of the environment in memory
+        dibujos = CELL_DRAWINGS.__getitem__
+        celdas = self.grid.cells
+        filas = [
+            "".join(map(dibujos, celdas[inicio:inicio + self.dimension]))
+            for inicio in range(0, self.grid.size, self.dimension)
+        ]
+        return "Situación del palacio:\n" + "\n".join(filas) + "\n\n"
+
+    def imprimir(self, solution=None, frontier=None, explored=None, salida=None):
+        # Print the current state of the environment with a single write
+        (salida or sys.stdout).write(self.renderizar())
 
     def actualizar_posicion_cw(self, nueva_posicion):
         # Update the position of the agent in the environment
         old_pos = self.cw
-        self.tablero[old_pos[0]][old_pos[1]] = " "
+        self.grid.cells[self.grid.index(old_pos)] = EMPTY
         self.cw = nueva_posicion
-        self.tablero[nueva_posicion[0]][nueva_posicion[1]] = "CW"
+        self.grid.cells[self.grid.index(nueva_posicion)] = CW
+        self.notificar("cw", self.grid.index(nueva_posicion))
 
 
 class AgentBFS:
@@ -85,69 +429,557 @@ class AgentBFS:
     """
     def __init__(self, environment):
         # Initialize the agent with the starting node in the frontier
-        self.frontier = [Node(state=environment.start)]
-        self.explored = set()
-        self.goal_state = environment.goal
+        # States are flat indices of the environment's compact grid
         self.environment = environment
+        self.grid = environment.grid
+        self.start_state = self.grid.index(environment.start)
+        self.goal_state = self.grid.index(environment.goal)
+        self.store = SearchNodeStore(self.grid.size)
+        self.store.add_root(self.start_state)
+        self.frontier = deque([self.start_state])
+        # Search metrics: expanded nodes and largest frontier seen
+        self.nodes_expanded = 0
+        self.peak_frontier = 1
 
     def actions(self, node):
-        # Define possible actions (movements) for the agent
-        row, col = node.state
-        possible_actions = [
-            ("arriba", (row - 1, col)),
-            ("abajo", (row + 1, col)),
-            ("izquierda", (row, col - 1)),
-            ("derecha", (row, col + 1)),
-        ]
-        return possible_actions
+        # Define possible actions (movements) for the agent inside the grid
+        return self.grid.neighbors(node.state)
 
     def result(self, node):
         # Generate child nodes based on the agent's actions
-        children = []
-        height = len(self.environment.tablero)
-        width = len(self.environment.tablero[0])
-
-        for action, (r, c) in self.actions(node):
-            if 0 <= r < height and 0 <= c < width:
-                children.append(Node(state=(r, c), parent=node, action=action))
-
-        return children
+        return [
+            Node(state=state, parent=node, action=action, cost=node.cost + 1)
+            for action, state in self.actions(node)
+        ]
 
     def is_goal(self, node):
         # Check if the agent has reached the goal state
         return node.state == self.goal_state
     
+    def render_solution(self, goal_node):
+        # Build the text of the solution path from the start to the goal state
+        lines = ["Ruta hacia Coronel Kurtz:\n"]
+        for node in self.extract_solution_path(goal_node):
+            lines.append(
+                f"Estado: {self.grid.position(node.state)} Acción: {node.action}\n\n"
+            )
+        lines.append("\n")
+        return "".join(lines)
+
     def print_solution(self, goal_node):
-        # Print the solution path from the start to the goal state
-        solution_path = self.extract_solution_path(goal_node)
-        print("Ruta hacia Coronel Kurtz:")
-        for node in solution_path:
-            print(node)
-        print()
+        # Print the solution path from the start to the goal state with a single write
+        sys.stdout.write(self.render_solution(goal_node))
 
     def extract_solution_path(self, goal_node):
         # Extract the solution path by traversing back through parent nodes
         path = []
         current_node = goal_node
         while current_node:
-            path.insert(0, current_node)
+            path.append(current_node)
             current_node = current_node.parent
+        path.reverse()
         return path
 
-    def solve(self):
+    def found_goal(self, goal_node, render=False):
+        # Move the agent to the goal state and, only if asked, show the route
+        # followed as one frame written in a single call
+        self.environment.actualizar_posicion_cw(self.grid.position(goal_node.state))
+        if render:
+            sys.stdout.write(
+                "¡Coronel Kurtz encontrado!\n"
+                + self.environment.renderizar()
+                + self.render_solution(goal_node)
+            )
+
+    def solve(self, render=False):
+        # Search the goal state and move the agent there; nothing is printed
+        # unless rendering is requested, so batch runs do no I/O
+        goal_node = self.search()
+        if goal_node is not None:
+            self.found_goal(goal_node, render)
+        return goal_node
+
+    def search(self):
         # Perform Breadth-First Search to find the goal state
+        # Each state is enqueued once, the first time the store reaches it
+        store = self.store
         while self.frontier:
-            current_node = self.frontier.pop(0)
-            self.explored.add(current_node.state)
-
-            if self.is_goal(current_node):
-                print("¡Coronel Kurtz encontrado!")
-                self.environment.actualizar_posicion_cw(current_node.state)
-                self.environment.imprimir()
+            state = self.frontier.popleft()
+            self.nodes_expanded += 1
 
-                self.print_solution(current_node)
-                return
+            if state == self.goal_state:
+                return store.node(state)
 
-            for child in self.result(current_node):
-                if child.state not in self.explored and child not in self.frontier:
+            cost = store.cost[state] + 1
+            for action, child in self.grid.neighbors(state):
+                if store.parent[child] < 0:
+                    store.add(child, state, action, cost)
                     self.frontier.append(child)
+            if len(self.frontier) > self.peak_frontier:
+                self.peak_frontier = len(self.frontier)
+        return None
+
+
+class AgentAStar(AgentBFS):
+    """
+    Class that represents an agent using A* search with a pluggable heuristic
+    """
+    def __init__(self, environment, heuristic=manhattan):
+        # Initialize the agent with the starting state in a priority queue
+        super().__init__(environment)
+        self.heuristic = heuristic
+        self.closed = bytearray(self.grid.size)
+        self.frontier = []
+        self.push(self.start_state)
+
+    def push(self, state):
+        # Add a state ordered by f = g + h, preferring deeper states on ties
+        cost = self.store.cost[state]
+        priority = cost + self.heuristic(self.grid.position(state), self.environment.goal)
+        heapq.heappush(self.frontier, (priority, -cost, state))
+
+    def search(self):
+        # Perform A* search to find the goal state
+        store = self.store
+        while self.frontier:
+            if len(self.frontier) > self.peak_frontier:
+                self.peak_frontier = len(self.frontier)
+            state = heapq.heappop(self.frontier)[-1]
+            if self.closed[state]:
+                continue
+            self.closed[state] = 1
+            self.nodes_expanded += 1
+
+            if state == self.goal_state:
+                return store.node(state)
+
+            cost = store.cost[state] + 1
+            for action, child in self.grid.neighbors(state):
+                if self.closed[child]:
+                    continue
+                if store.parent[child] < 0 or cost < store.cost[child]:
+                    store.add(child, state, action, cost)
+                    self.push(child)
+        return None
+
+
+class AgentBidirectionalBFS(AgentBFS):
+    """
+    Class that represents an agent using bidirectional Breadth-First Search
+    """
+    def __init__(self, environment):
+        # Initialize one frontier from the start and another one from the goal
+        super().__init__(environment)
+        self.backward_store = SearchNodeStore(self.grid.size)
+        self.backward_store.add_root(self.goal_state)
+        self.backward_frontier = deque([self.goal_state])
+
+    def expand_layer(self, frontier, store, other_store):
+        # Expand a whole layer of a frontier and return the best meeting found
+        best_meeting = None
+        for _ in range(len(frontier)):
+            state = frontier.popleft()
+            self.nodes_expanded += 1
+            cost = store.cost[state] + 1
+            for action, child in self.grid.neighbors(state):
+                if store.parent[child] >= 0:
+                    continue
+                store.add(child, state, action, cost)
+                frontier.append(child)
+                if other_store.parent[child] >= 0:
+                    total_cost = cost + other_store.cost[child]
+                    if best_meeting is None or total_cost < best_meeting[0]:
+                        best_meeting = (total_cost, child)
+        return best_meeting
+
+    def join(self, meeting_state):
+        # Build the goal node by chaining the backward half onto the forward one
+        path = self.store.path(meeting_state)
+        backward = self.backward_store
+        state = meeting_state
+        while backward.parent[state] != state:
+            action = OPPOSITE_ACTIONS[ACTIONS[backward.action[state]]]
+            state = backward.parent[state]
+            path.append((state, action))
+        return nodes_from_path(path)
+
+    def search(self):
+        # Grow both searches, always expanding the smaller frontier
+        if self.goal_state == self.start_state:
+            return self.store.node(self.goal_state)
+
+        while self.frontier and self.backward_frontier:
+            self.peak_frontier = max(
+                self.peak_frontier, len(self.frontier) + len(self.backward_frontier)
+            )
+            if len(self.frontier) <= len(self.backward_frontier):
+                meeting = self.expand_layer(
+                    self.frontier, self.store, self.backward_store
+                )
+            else:
+                meeting = self.expand_layer(
+                    self.backward_frontier, self.backward_store, self.store
+                )
+            if meeting is not None:
+                return self.join(meeting[1])
+        return None
+
+
+class AgentIDAStar(AgentBFS):
+    """
+    Class that represents an agent using Iterative Deepening A* search
+    """
+    def __init__(self, environment, heuristic=manhattan, table_size=2**16):
+        # Initialize the agent, which keeps the current path in memory and a
+        # transposition table of at most table_size states per iteration
+        # (no node store or frontier covering the whole grid)
+        self.environment = environment
+        self.grid = environment.grid
+        self.start_state = self.grid.index(environment.start)
+        self.goal_state = self.grid.index(environment.goal)
+        self.nodes_expanded = 0
+        self.peak_frontier = 1
+        self.heuristic = heuristic
+        self.table_size = table_size
+
+    def estimate(self, node):
+        # Heuristic estimate of the cost from a node to the goal state
+        return self.heuristic(self.grid.position(node.state), self.environment.goal)
+
+    def ordered_children(self, node):
+        # Generate the children of a node, most promising first
+        return iter(sorted(self.result(node), key=self.estimate))
+
+    def bounded_search(self, root, bound):
+        # Depth-first search pruning nodes whose f exceeds the bound
+        # States already reached in this iteration with a cost no greater are
+        # pruned too, so each bound does not walk every simple path again; once
+        # the table is full it is only read, so memory stays bounded
+        next_bound = math.inf
+        stack = [(root, self.ordered_children(root))]
+        on_path = {root.state}
+        best_cost = {root.state: 0}
+        self.nodes_expanded += 1
+
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                on_path.discard(node.state)
+                continue
+
+            f = child.cost + self.estimate(child)
+            if f > bound:
+                next_bound = min(next_bound, f)
+                continue
+            if child.state in on_path or best_cost.get(child.state, math.inf) <= child.cost:
+                continue
+            if self.is_goal(child):
+                return child, bound
+
+            if len(best_cost) < self.table_size or child.state in best_cost:
+                best_cost[child.state] = child.cost
+            on_path.add(child.state)
+            stack.append((child, self.ordered_children(child)))
+            self.nodes_expanded += 1
+            if len(stack) > self.peak_frontier:
+                self.peak_frontier = len(stack)
+
+        return None, next_bound
+
+    def search(self):
+        # Repeat bounded searches increasing the f bound until the goal is found
+        root = Node(state=self.start_state)
+        if self.is_goal(root):
+            return root
+
+        bound = self.estimate(root)
+        goal_node, bound = self.bounded_search(root, bound)
+        # Without a closed set the bound would grow forever if the goal is
+        # walled off, so reachability is checked once the first bound fails
+        if goal_node is None and bound != math.inf and not self.goal_reachable():
+            return None
+
+        while goal_node is None and bound != math.inf:
+            goal_node, bound = self.bounded_search(root, bound)
+        return goal_node
+
+    def goal_reachable(self):
+        # Check if the goal can be reached from the start, with the cached
+        # distance field if there is one or else with a BFS that stops at the
+        # goal, whose expansions are counted too
+        environment = self.environment
+        if environment.campo_calculado():
+            return environment.campo[self.start_state] >= 0
+
+        reached = {self.start_state}
+        queue = deque([self.start_state])
+        while queue:
+            state = queue.popleft()
+            self.nodes_expanded += 1
+            if state == self.goal_state:
+                return True
+            for _, child in self.grid.neighbors(state):
+                if child not in reached:
+                    reached.add(child)
+                    queue.append(child)
+        return False
+
+
+class AgentDistanceField(AgentBFS):
+    """
+    Class that represents an agent that follows the environment's cached goal-distance field
+    """
+    def __init__(self, environment, start=None):
+        # Initialize the agent, optionally from a start other than the environment's
+        super().__init__(environment)
+        if start is not None:
+            self.start_state = self.grid.index(start)
+
+    def search(self):
+        # Walk down the distance field from the start state to the goal state
+        # The reverse BFS is counted too when this search has to build the field
+        current_node = Node(state=self.start_state)
+        built = not self.environment.campo_calculado()
+        steps = self.environment.pasos_hacia_objetivo(
+            self.grid.position(self.start_state)
+        )
+        if built:
+            self.nodes_expanded += self.environment.expansiones_campo
+        if steps is None:
+            return None
+
+        self.nodes_expanded += 1
+        for action, state in steps:
+            current_node = Node(
+                state=state, parent=current_node, action=action, cost=current_node.cost + 1
+            )
+            self.nodes_expanded += 1
+        return current_node
+
+
+class AgentWavefrontBFS(AgentBFS):
+    """
+    Class that represents an agent using Breadth-First Search vectorized with NumPy
+    """
+    def __init__(self, environment):
+        # Initialize the agent with whole-grid arrays instead of a node queue
+        super().__init__(environment)
+        self.distance = np.full(self.grid.size, -1, dtype=np.int64)
+        self.order = np.full(self.grid.size, -1, dtype=np.int64)
+        self.parent_action = np.zeros(self.grid.size, dtype=np.uint8)
+        self.cells = np.frombuffer(self.grid.cells, dtype=np.uint8)
+
+    def next_layer(self, layer):
+        # Shift the whole layer once per action and keep, for each new cell,
+        # the smallest (parent rank, action) key. That is exactly the order in
+        # which AgentBFS would enqueue the children, so parents and paths match
+        n = self.grid.dimension
+        cols = layer % n
+        moves = (
+            (layer >= n, -n),
+            (layer < self.grid.size - n, n),
+            (cols > 0, -1),
+            (cols < n - 1, 1),
+        )
+        children = []
+        keys = []
+        for code, (inside, offset) in enumerate(moves):
+            parents = layer[inside]
+            reached = parents + offset
+            new = (self.distance[reached] < 0) & (self.cells[reached] != OBSTACLE)
+            children.append(reached[new])
+            keys.append(self.order[parents[new]] * 4 + code)
+
+        children = np.concatenate(children)
+        keys = np.concatenate(keys)
+        sort = np.argsort(keys)
+        children, keys = children[sort], keys[sort]
+        first = np.sort(np.unique(children, return_index=True)[1])
+        return children[first], keys[first]
+
+    def expand(self, until_goal=True):
+        # Expand whole BFS layers at once until the goal (or every cell) is reached
+        self.distance.fill(-1)
+        self.order.fill(-1)
+        layer = np.array([self.start_state], dtype=np.int64)
+        self.distance[self.start_state] = 0
+        self.order[self.start_state] = 0
+        next_rank = 1
+        depth = 0
+
+        while len(layer) and not (until_goal and self.distance[self.goal_state] >= 0):
+            self.peak_frontier = max(self.peak_frontier, len(layer))
+            layer, keys = self.next_layer(layer)
+            depth += 1
+            self.distance[layer] = depth
+            self.order[layer] = np.arange(next_rank, next_rank + len(layer))
+            self.parent_action[layer] = keys % 4
+            next_rank += len(layer)
+
+    def distance_map(self):
+        # Distance from the start to every cell (-1 if unreachable), same as AgentBFS
+        self.expand(until_goal=False)
+        return self.distance.reshape(self.grid.dimension, self.grid.dimension)
+
+    def search(self):
+        # Expand layers until the goal is reached and rebuild the path backwards
+        self.expand()
+        if self.distance[self.goal_state] < 0:
+            # Like AgentBFS, every reachable state has been expanded
+            self.nodes_expanded = int(np.count_nonzero(self.distance >= 0))
+            return None
+
+        # AgentBFS expands every state dequeued up to and including the goal
+        self.nodes_expanded = int(self.order[self.goal_state]) + 1
+
+        n = self.grid.dimension
+        offsets = (-n, n, -1, 1)
+        path = []
+        state = self.goal_state
+        while state != self.start_state:
+            code = int(self.parent_action[state])
+            path.append((state, ACTIONS[code]))
+            state -= offsets[code]
+        path.append((self.start_state, None))
+        path.reverse()
+        return nodes_from_path(path)
+
+
+class AgentDStarLite(AgentBFS):
+    """
+    Class that represents an agent using D* Lite incremental replanning
+    """
+    def __init__(self, environment, heuristic=manhattan):
+        # Search backwards from the goal so that the agent can move and the
+        # map can change while the previous search is reused
+        super().__init__(environment)
+        self.heuristic = heuristic
+        self.reset()
+        environment.suscribir(self.notify)
+
+    def detach(self):
+        # Stop following the changes of the environment
+        self.environment.desuscribir(self.notify)
+
+    def reset(self):
+        # Start a new search from the current position to the current goal
+        self.start_state = self.grid.index(self.environment.cw)
+        self.goal_state = self.grid.index(self.environment.goal)
+        self.last_state = self.start_state
+        self.km = 0
+        self.g = array("d", [math.inf]) * self.grid.size
+        self.rhs = array("d", [math.inf]) * self.grid.size
+        self.rhs[self.goal_state] = 0
+        self.frontier = []
+        self.push(self.goal_state)
+        self.changed_cells = set()
+
+    def notify(self, event, index):
+        # Record the changes of the environment to be repaired on the next search
+        if event == "cw":
+            self.start_state = index
+        else:
+            self.changed_cells.add(index)
+
+    def distance(self, a, b):
+        # Heuristic distance between two states
+        return self.heuristic(self.grid.position(a), self.grid.position(b))
+
+    def calculate_key(self, state):
+        # Priority of a state in the D* Lite queue
+        best = min(self.g[state], self.rhs[state])
+        return (best + self.distance(self.start_state, state) + self.km, best)
+
+    def push(self, state):
+        # Add a state to the queue with its current key
+        heapq.heappush(self.frontier, (*self.calculate_key(state), state))
+
+    def update_vertex(self, state):
+        # Recompute the one-step lookahead cost of a state and queue it if inconsistent
+        if state != self.goal_state:
+            if self.grid.is_blocked(state):
+                self.rhs[state] = math.inf
+            else:
+                self.rhs[state] = min(
+                    (self.g[child] + 1 for _, child in self.grid.neighbors(state)),
+                    default=math.inf,
+                )
+        if self.g[state] != self.rhs[state]:
+            self.push(state)
+
+    def compute_shortest_path(self):
+        # Process inconsistent states until the start state is consistent
+        while self.frontier and (
+            self.frontier[0][:2] < self.calculate_key(self.start_state)
+            or self.rhs[self.start_state] != self.g[self.start_state]
+        ):
+            if len(self.frontier) > self.peak_frontier:
+                self.peak_frontier = len(self.frontier)
+            *old_key, state = heapq.heappop(self.frontier)
+            if self.g[state] == self.rhs[state]:
+                continue
+            new_key = self.calculate_key(state)
+            if tuple(old_key) < new_key:
+                heapq.heappush(self.frontier, (*new_key, state))
+                continue
+            if tuple(old_key) > new_key:
+                continue
+
+            self.nodes_expanded += 1
+            if self.g[state] > self.rhs[state]:
+                self.g[state] = self.rhs[state]
+            else:
+                self.g[state] = math.inf
+                self.update_vertex(state)
+            for _, neighbor in self.grid.neighbors(state):
+                self.update_vertex(neighbor)
+
+    def repair(self):
+        # Apply the changes recorded since the last search
+        if self.start_state != self.last_state:
+            self.km += self.distance(self.last_state, self.start_state)
+            self.last_state = self.start_state
+        for state in self.changed_cells:
+            self.update_vertex(state)
+            for _, neighbor in self.grid.neighbors(state):
+                self.update_vertex(neighbor)
+        self.changed_cells.clear()
+
+    def next_step(self, state):
+        # Best move from a state: the neighbor with the lowest cost to the goal
+        return min(
+            self.grid.neighbors(state),
+            key=lambda move: self.g[move[1]],
+            default=None,
+        )
+
+    def search(self):
+        # Repair the previous search and follow the costs from the start to the goal
+        if self.goal_state != self.grid.index(self.environment.goal):
+            self.reset()
+        self.repair()
+        self.compute_shortest_path()
+        if self.g[self.start_state] == math.inf:
+            return None
+
+        path = [(self.start_state, None)]
+        state = self.start_state
+        while state != self.goal_state:
+            action, state = self.next_step(state)
+            path.append((state, action))
+        return nodes_from_path(path)
+
+
+# Search strategies that can be selected when playing with the search agent
+SEARCH_AGENTS = {
+    "anchura": AgentBFS,
+    "a estrella": AgentAStar,
+    "a estrella octil": partial(AgentAStar, heuristic=octile),
+    "bidireccional": AgentBidirectionalBFS,
+    "ida estrella": AgentIDAStar,
+    "campo de distancias": AgentDistanceField,
+    "anchura vectorizada": AgentWavefrontBFS,
+    "d estrella lite": AgentDStarLite,
+}
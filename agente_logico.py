@@ -12,8 +12,13 @@ Definición de las clases usadas en el agente lógico.
 
 # Import necessary modules
 
+import math
 import random
-from colorama import Fore
+import shutil
+import sys
+
+import numpy as np
+from colorama import Fore, just_fix_windows_console
 
 
 class Room:
@@ -45,9 +50,12 @@ class Palace:
         (Room("|:CK:|", Fore.BLUE, (0, 0)), 1),
     ]
 
-    def __init__(self, dimension):
+    def __init__(self, dimension, seed=None, generate=True):
         # Initialize the palace with a given dimension
+        # A seed makes the random placement of the elements reproducible;
+        # without generate the board is left empty (to restore a saved palace)
         self.dimension = dimension
+        self.random = random.Random(seed)
 
         # Define base, entry, and exit cells
         self.base_cell = Room("|::::|", "", (0, 0))
@@ -57,50 +65,82 @@ class Palace:
         # Create a 2D board filled with base cells
         self.board = [[self.base_cell] * self.dimension for _ in range(self.dimension)]
 
+        # Index of the positions of every element that is not a base cell
+        self.element_positions = {}
+
+        # Counter bumped on every change of the board (keys the perception cache)
+        self.version = 0
+
         # Generate the map with entry, exit, and special elements
-        self.generate_map()
+        if generate:
+            self.generate_map()
 
     def generate_map(self):
+        # Free cells to draw positions from, without the entry cell; the cells
+        # next to the entry are kept apart because hazards cannot go there
+        entry_adjacent = [(1, 0), (0, 1)]
+        self.free_cells = [
+            (x, y)
+            for x in range(self.dimension)
+            for y in range(self.dimension)
+            if (x, y) != (0, 0) and (x, y) not in entry_adjacent
+        ]
+        self.free_entry_cells = [
+            (x, y) for x, y in entry_adjacent if x < self.dimension and y < self.dimension
+        ]
+
         # Set the entry cell at position (0, 0)
         entry_x, entry_y = 0, 0
-        self.board[entry_x][entry_y] = self.entry_cell
+        self.set_room((entry_x, entry_y), self.entry_cell)
 
         # Set the exit cell at a random position
         exit_x, exit_y = self.get_random_position()
-        self.board[exit_x][exit_y] = self.exit_cell
+        self.set_room((exit_x, exit_y), self.exit_cell)
 
         # Place special elements on the map
         for room, count in self.elements:
             if room.element == "|:CW:|":
-                self.board[0][0] = room
+                self.set_room((0, 0), room)
             elif room.element == "|:CK:|":
                 self.place_element(room, count)
             else:
                 self.place_other_element(room, count)
 
+    def take_position(self, cells, index):
+        # Remove and return the cell at an index of a list of free cells
+        cells[index], cells[-1] = cells[-1], cells[index]
+        return cells.pop()
+
     def get_random_position(self):
         # Get a random position on the map that is not occupied
-        while True:
-            x, y = random.randint(0, self.dimension - 1), random.randint(
-                0, self.dimension - 1
-            )
-            if self.board[x][y] == self.base_cell:
-                return x, y
+        index = self.random.randrange(len(self.free_cells) + len(self.free_entry_cells))
+        if index < len(self.free_cells):
+            return self.take_position(self.free_cells, index)
+        return self.take_position(self.free_entry_cells, index - len(self.free_cells))
 
     def place_element(self, room, count):
         # Place a specific element on the map in random positions
         for _ in range(count):
             x, y = self.get_random_position()
-            self.board[x][y] = room
+            self.set_room((x, y), room)
 
     def place_other_element(self, room, count):
         # Place elements (excluding specific positions) on the map in random positions
         for _ in range(count):
-            while True:
-                x, y = self.get_random_position()
-                if (x, y) != (1, 0) and (x, y) != (0, 1):
-                    break
-            self.board[x][y] = room
+            index = self.random.randrange(len(self.free_cells))
+            x, y = self.take_position(self.free_cells, index)
+            self.set_room((x, y), room)
+
+    def set_room(self, position, room):
+        # Put a room in a cell of the board keeping the element index up to date
+        x, y = position
+        self.version += 1
+        old_room = self.board[x][y]
+        if old_room is not self.base_cell:
+            self.element_positions[old_room.element].discard(position)
+        self.board[x][y] = room
+        if room is not self.base_cell:
+            self.element_positions.setdefault(room.element, set()).add(position)
 
     def display_palace(self):
         # Print the current state of the palace board
@@ -118,13 +158,17 @@ class Palace:
             print()
 
     def find_element_position(self, element):
-        # Find the position of a specific element on the map
-        for x in range(self.dimension):
-            for y in range(self.dimension):
-                if self.board[x][y].element == element:
-                    return x, y
+        # Find the position of a specific element on the map using the index
+        # (the first one in reading order if the element appears several times)
+        positions = self.element_positions.get(element)
+        if positions:
+            return min(positions)
         return None
 
+    def find_element_positions(self, element):
+        # Find all the positions of a specific element on the map
+        return set(self.element_positions.get(element, ()))
+
     def is_precipice(self, position):
         # Check if a specific position contains a precipice
         x, y = position
@@ -154,6 +198,122 @@ class Palace:
         )
 
 
+def random_layouts(count, dimension=6, seed=None):
+    # Draw the maps of many palaces at once, with the same distribution as
+    # Palace.generate_map. Yields blocks of rows with the flat cell indices of
+    # the exit, the precipices, the monster and Colonel Kurtz
+    rng = np.random.default_rng(seed)
+    size = dimension * dimension
+    hazards = sum(
+        number for room, number in Palace.elements if room.element in ("|:P::|", "|:M::|")
+    )
+    forbidden = [0] + [
+        x * dimension + y for x, y in ((1, 0), (0, 1)) if x < dimension and y < dimension
+    ]
+    block = max(1, 2**22 // size)
+
+    while count > 0:
+        rows = min(count, block)
+        index = np.arange(rows)[:, None]
+
+        # The exit goes in any cell but the entry
+        exits = rng.integers(1, size, rows)
+
+        # Hazards take distinct free cells away from the entry, in random order
+        keys = rng.random((rows, size))
+        keys[:, forbidden] = np.inf
+        keys[index[:, 0], exits] = np.inf
+        chosen = np.argpartition(keys, hazards - 1, axis=1)[:, :hazards]
+        order = np.argsort(keys[index, chosen], axis=1)
+        hazard_cells = np.take_along_axis(chosen, order, axis=1)
+
+        # Colonel Kurtz goes in any cell that is still free
+        keys = rng.random((rows, size))
+        keys[:, 0] = np.inf
+        keys[index[:, 0], exits] = np.inf
+        keys[index, hazard_cells] = np.inf
+        kurtz = np.argmin(keys, axis=1)
+
+        yield np.column_stack((exits, hazard_cells, kurtz))
+        count -= rows
+
+
+class PalaceRenderer:
+    """
+    Class that represents a terminal view of the palace that only redraws the changed cells
+    """
+
+    def __init__(self, palace, output=None):
+        # Initialize the renderer of a palace: the full board, a blank line and
+        # the player's view are kept at the top of the terminal
+        self.palace = palace
+        self.output = output or sys.stdout
+        self.height = 2 * palace.dimension + 1
+        self.room_strings = {}
+        self.frame = None
+        self.interactive = self.output.isatty()
+
+    def room_string(self, room):
+        # Pre-rendered string of a room, built once per element and color
+        key = (room.element, room.color)
+        string = self.room_strings.get(key)
+        if string is None:
+            string = self.room_strings[key] = str(room)
+        return string
+
+    def build_frame(self, captain_position):
+        # Strings of every cell of both boards, row by row
+        hidden = "|::::|"
+        frame = [[self.room_string(room) for room in row] for row in self.palace.board]
+        frame.append([])
+        for i, row in enumerate(self.palace.board):
+            frame.append(
+                [
+                    self.room_string(room) if (i, j) == captain_position else hidden
+                    for j, room in enumerate(row)
+                ]
+            )
+        return frame
+
+    def start(self):
+        # Clear the screen and let the text scroll only below the boards
+        if self.interactive:
+            just_fix_windows_console()
+            lines = shutil.get_terminal_size().lines
+            self.output.write(
+                f"\x1b[2J\x1b[{self.height + 2};{max(lines, self.height + 2)}r"
+                f"\x1b[{self.height + 2};1H"
+            )
+            self.output.flush()
+        self.frame = None
+
+    def draw(self, captain_position):
+        # Write the cells that changed since the last frame in a single write
+        frame = self.build_frame(captain_position)
+        if not self.interactive:
+            self.output.write("\n".join("".join(row) for row in frame) + "\n")
+            self.output.flush()
+            return
+
+        parts = ["\x1b7"]
+        for i, row in enumerate(frame):
+            previous = self.frame[i] if self.frame is not None else None
+            for j, string in enumerate(row):
+                if previous is None or previous[j] != string:
+                    parts.append(f"\x1b[{i + 1};{6 * j + 1}H{string}")
+        parts.append("\x1b8")
+        self.frame = frame
+        if len(parts) > 2:
+            self.output.write("".join(parts))
+            self.output.flush()
+
+    def stop(self):
+        # Give the whole terminal back to the text
+        if self.interactive:
+            self.output.write("\x1b[r\x1b[999;1H\n")
+            self.output.flush()
+
+
 class CaptainWillard:
     """
     Class that represents Captain Willard
@@ -168,6 +328,12 @@ class CaptainWillard:
         self.kurtz_found = False
         self.explored_cells = []
 
+        # Counter bumped when Captain Willard moves; the perception is cached
+        # until this counter or the palace's one changes
+        self.version = 0
+        self.perception = None
+        self.perception_version = None
+
     # Captain Willard's actions: MOVE, DETONATE, EXIT
 
     def move(self, direction):
@@ -176,6 +342,7 @@ class CaptainWillard:
 
         if self.is_valid_move(new_position):
             # Update explored cells and handle specific cases (precipice, monster, Kurtz)
+            self.version += 1
             self.explored_cells.append(self.position)
             x, y = self.position
 
@@ -183,10 +350,9 @@ class CaptainWillard:
                 self.palace.board[new_position[0]][new_position[1]]
                 == self.palace.base_cell
             ):
-                (
-                    self.palace.board[x][y],
-                    self.palace.board[new_position[0]][new_position[1]],
-                ) = (self.palace.base_cell, self.palace.board[x][y])
+                captain_room = self.palace.board[x][y]
+                self.palace.set_room((x, y), self.palace.base_cell)
+                self.palace.set_room(new_position, captain_room)
 
             else:
                 if self.palace.is_precipice(new_position):
@@ -204,11 +370,9 @@ class CaptainWillard:
                 else:
                     if self.palace.is_coronel(new_position):
                         self.kurtz_found = True
-                        (
-                            self.palace.board[x][y],
-                            self.palace.board[new_position[0]][new_position[1]],
-                        ) = self.palace.base_cell, Room(
-                            "|CWCK|", Fore.LIGHTYELLOW_EX, (0, 0)
+                        self.palace.set_room((x, y), self.palace.base_cell)
+                        self.palace.set_room(
+                            new_position, Room("|CWCK|", Fore.LIGHTYELLOW_EX, (0, 0))
                         )
                         print(
                             "Está en la misma celda que en Coronel Kurtz, ahora viaja junto a él."
@@ -255,8 +419,7 @@ class CaptainWillard:
 
     def defeat_monster(self, monster_position):
         # Remove the defeated monster from the board
-        x, y = monster_position
-        self.palace.board[x][y] = self.palace.base_cell
+        self.palace.set_room(monster_position, self.palace.base_cell)
 
     def get_adjacent_cells(self):
         # Get the positions of cells adjacent to Captain Willard's current position
@@ -281,7 +444,16 @@ class CaptainWillard:
     # Captain Willard's perceptions
 
     def get_perception(self):
-        # Get perceptions based on Captain Willard's current state
+        # Get perceptions based on Captain Willard's current state, computing
+        # them again only if he has moved or the board has changed
+        version = (self.version, self.palace.version)
+        if self.perception_version != version:
+            self.perception = self.calculate_perception()
+            self.perception_version = version
+        return list(self.perception)
+
+    def calculate_perception(self):
+        # Calculate the perceptions from the board
         adjacent_cells = self.get_adjacent_cells()
         monster_position = self.palace.find_element_position("|:M::|")
         exit_position = self.palace.find_element_position("|:S::|")
@@ -309,6 +481,281 @@ class CaptainWillard:
         ]
 
 
+def dpll(clauses, assignment):
+    # Check if a list of clauses is satisfiable extending a partial assignment
+    # (dict variable -> bool) with unit propagation and branching
+    while True:
+        simplified = []
+        unit = None
+        for clause in clauses:
+            unassigned = []
+            for literal in clause:
+                value = assignment.get(abs(literal))
+                if value is None:
+                    unassigned.append(literal)
+                elif value == (literal > 0):
+                    break
+            else:
+                if not unassigned:
+                    return False
+                if len(unassigned) == 1:
+                    unit = unassigned[0]
+                simplified.append(unassigned)
+        if not simplified:
+            return True
+        if unit is None:
+            break
+        assignment[abs(unit)] = unit > 0
+        clauses = simplified
+
+    literal = simplified[0][0]
+    for choice in (literal, -literal):
+        branch = dict(assignment)
+        branch[abs(choice)] = choice > 0
+        if dpll(simplified, branch):
+            return True
+    return False
+
+
+class PropositionalKB:
+    """
+    Class that represents a propositional knowledge base with incremental unit propagation
+    """
+
+    def __init__(self):
+        # Clauses are lists of integer literals (v or -v); the first two
+        # literals of every stored clause are the ones being watched
+        self.clauses = []
+        self.watches = {}
+        self.assignment = {}
+        self.trail = []
+        self.consistent = True
+        self.version = 0
+        self.entailment_cache = {}
+        self.cache_version = 0
+
+    def value(self, literal):
+        # Truth value of a literal under the propagated facts (None if unknown)
+        value = self.assignment.get(abs(literal))
+        if value is None:
+            return None
+        return value == (literal > 0)
+
+    def tell(self, clause):
+        # Add a clause and propagate only the facts it makes necessary
+        self.version += 1
+        open_literals = []
+        for literal in dict.fromkeys(clause):
+            value = self.value(literal)
+            if value:
+                return
+            if value is None:
+                open_literals.append(literal)
+
+        if not open_literals:
+            self.consistent = False
+        elif len(open_literals) == 1:
+            self.propagate([open_literals[0]])
+        else:
+            self.clauses.append(open_literals)
+            index = len(self.clauses) - 1
+            self.watches.setdefault(open_literals[0], []).append(index)
+            self.watches.setdefault(open_literals[1], []).append(index)
+
+    def propagate(self, pending):
+        # Assign the pending literals and visit only the clauses watching their negation
+        while pending:
+            literal = pending.pop()
+            value = self.value(literal)
+            if value:
+                continue
+            if value is False:
+                self.consistent = False
+                return
+            self.assignment[abs(literal)] = literal > 0
+            self.trail.append(literal)
+
+            false_literal = -literal
+            still_watching = []
+            for index in self.watches.pop(false_literal, []):
+                clause = self.clauses[index]
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], clause[0]
+                if self.value(clause[0]):
+                    still_watching.append(index)
+                    continue
+                for position in range(2, len(clause)):
+                    if self.value(clause[position]) is not False:
+                        clause[1], clause[position] = clause[position], clause[1]
+                        self.watches.setdefault(clause[1], []).append(index)
+                        break
+                else:
+                    still_watching.append(index)
+                    pending.append(clause[0])
+            if still_watching:
+                self.watches.setdefault(false_literal, []).extend(still_watching)
+
+    def entails(self, literal):
+        # Check if the knowledge base entails a literal: first with the
+        # propagated facts, then refuting its negation with DPLL
+        value = self.value(literal)
+        if value is not None or not self.consistent:
+            return value is not False
+        if self.cache_version != self.version:
+            self.entailment_cache = {}
+            self.cache_version = self.version
+        if literal not in self.entailment_cache:
+            assignment = dict(self.assignment)
+            assignment[abs(literal)] = literal < 0
+            self.entailment_cache[literal] = not dpll(self.clauses, assignment)
+        return self.entailment_cache[literal]
+
+    def copy(self):
+        # Independent copy of the knowledge base, to fork it for lookahead
+        kb = PropositionalKB()
+        kb.clauses = [list(clause) for clause in self.clauses]
+        kb.watches = {literal: list(indices) for literal, indices in self.watches.items()}
+        kb.assignment = dict(self.assignment)
+        kb.trail = list(self.trail)
+        kb.consistent = self.consistent
+        kb.version = self.version
+        kb.entailment_cache = dict(self.entailment_cache)
+        kb.cache_version = self.cache_version
+        return kb
+
+
+class FrontierRiskSolver:
+    """
+    Class that computes exact hazard probabilities splitting the frontier into independent components
+    """
+
+    def __init__(self):
+        # Counts of every component already enumerated, reused across turns
+        self.cache = {}
+
+    def split_components(self, constraints):
+        # Group the constraints that share cells (union-find over frontier cells)
+        parent = {}
+
+        def find(cell):
+            while parent[cell] != cell:
+                parent[cell] = parent[parent[cell]]
+                cell = parent[cell]
+            return cell
+
+        for constraint in constraints:
+            cells = list(constraint)
+            for cell in cells:
+                parent.setdefault(cell, cell)
+            for cell in cells[1:]:
+                parent[find(cell)] = find(cells[0])
+
+        components = {}
+        for constraint in constraints:
+            root = find(next(iter(constraint)))
+            components.setdefault(root, set()).add(constraint)
+        return list(components.values())
+
+    def component_counts(self, constraints, max_hazards):
+        # Count the hazard placements of a component that satisfy all its
+        # constraints, by number of hazards k: totals[k] and per-cell counts
+        key = (frozenset(constraints), max_hazards)
+        if key in self.cache:
+            return self.cache[key]
+
+        cells = sorted(set().union(*constraints))
+        index = {cell: i for i, cell in enumerate(cells)}
+        # Constraints checked when their last cell gets its value
+        closing = [[] for _ in cells]
+        for constraint in constraints:
+            members = [index[cell] for cell in constraint]
+            closing[max(members)].append(members)
+
+        totals = [0] * (max_hazards + 1)
+        per_cell = [[0] * len(cells) for _ in range(max_hazards + 1)]
+        values = [0] * len(cells)
+
+        def backtrack(i, hazards):
+            if i == len(cells):
+                totals[hazards] += 1
+                for j, value in enumerate(values):
+                    if value:
+                        per_cell[hazards][j] += 1
+                return
+            for value in (0, 1):
+                if hazards + value > max_hazards:
+                    continue
+                values[i] = value
+                if all(any(values[j] for j in members) for members in closing[i]):
+                    backtrack(i + 1, hazards + value)
+            values[i] = 0
+
+        backtrack(0, 0)
+        result = (cells, totals, per_cell)
+        if len(self.cache) > 10000:
+            self.cache.clear()
+        self.cache[key] = result
+        return result
+
+    def convolve(self, distributions, max_hazards):
+        # Number of placements by total hazards of several independent components
+        total = [1] + [0] * max_hazards
+        for distribution in distributions:
+            combined = [0] * (max_hazards + 1)
+            for i, a in enumerate(total):
+                if a:
+                    for j, b in enumerate(distribution[: max_hazards + 1 - i]):
+                        combined[i + j] += a * b
+            total = combined
+        return total
+
+    def probabilities(self, constraints, unconstrained, hazards):
+        # Exact probability of a hazard in every frontier cell, and in any of
+        # the unconstrained unknown cells, given that hazards are left among
+        # the unknown cells and each constraint holds at least one of them;
+        # also the number of placements those probabilities are taken over
+        components = [
+            self.component_counts(component, hazards)
+            for component in self.split_components(constraints)
+        ]
+        distributions = [totals for _, totals, _ in components]
+        everything = self.convolve(distributions, hazards)
+        weight = sum(
+            count * math.comb(unconstrained, hazards - k)
+            for k, count in enumerate(everything)
+        )
+        if weight == 0:
+            return {}, 0.0, 0
+
+        frontier = {}
+        for position, (cells, totals, per_cell) in enumerate(components):
+            rest = self.convolve(
+                distributions[:position] + distributions[position + 1:], hazards
+            )
+            ways = [
+                sum(
+                    count * math.comb(unconstrained, hazards - k - t)
+                    for t, count in enumerate(rest[: hazards - k + 1])
+                )
+                for k in range(hazards + 1)
+            ]
+            for j, cell in enumerate(cells):
+                favourable = sum(per_cell[k][j] * ways[k] for k in range(hazards + 1))
+                frontier[cell] = favourable / weight
+
+        other = 0.0
+        if unconstrained:
+            other = (
+                sum(
+                    count * math.comb(unconstrained - 1, hazards - k - 1)
+                    for k, count in enumerate(everything)
+                    if hazards - k >= 1
+                )
+                / weight
+            )
+        return frontier, other, weight
+
+
 class LogicAgent:
     """
     Class that represents a logical agent
@@ -323,51 +770,276 @@ class LogicAgent:
             "Coronel": set(),
         }
         self.capitan = capitan
+        self.dimension = capitan.palace.dimension
+        # The palace never puts a hazard in the entry or next to it
+        self.hazard_free = {(0, 0), (1, 0), (0, 1)}
+
+        # Propositional knowledge base with the palace rules and the percepts
+        # (breeze, smell) observed in every visited cell
+        self.observations = {}
+        self.reset_kb()
+        self.risk_solver = FrontierRiskSolver()
+        # Hazard probabilities of the last state of the KB they were asked for
+        self.hazard_cache = None
+
+    # Propositional symbols: precipice and monster in every cell
+
+    def precipice(self, cell):
+        return 1 + cell[0] * self.dimension + cell[1]
+
+    def monster(self, cell):
+        return 1 + self.dimension**2 + cell[0] * self.dimension + cell[1]
+
+    def cell_of(self, variable):
+        return divmod((variable - 1) % self.dimension**2, self.dimension)
+
+    def adjacent_cells(self, cell):
+        # Cells orthogonally adjacent to a cell inside the palace
+        x, y = cell
+        adjacent_cells = [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
+        return [
+            (i, j)
+            for i, j in adjacent_cells
+            if 0 <= i < self.dimension and 0 <= j < self.dimension
+        ]
+
+    def reset_kb(self):
+        # Build the knowledge base again from the observations
+        self.kb = PropositionalKB()
+        self.trail_seen = 0
+        self.monster_gone = self.capitan.monster_defeated
+        self.monster_area = None
+        self.knowledge_base["Precipicios"] = set()
+        self.knowledge_base["Monstruo"] = set()
+        for cell, (breezy, smelly) in self.observations.items():
+            self.tell_observation(cell, breezy, smelly)
+        self.sync_knowledge()
+
+    def tell_observation(self, cell, breezy, smelly):
+        # Tell the rules breeze <=> adjacent precipice and smell <=> adjacent
+        # monster for a visited cell, which holds neither of them
+        adjacent_cells = self.adjacent_cells(cell)
+        self.kb.tell([-self.precipice(cell)])
+        self.kb.tell([-self.monster(cell)])
+
+        if breezy:
+            self.kb.tell([self.precipice(other) for other in adjacent_cells])
+            # Cells already known to be free of precipices are not candidates
+            self.knowledge_base["Precipicios"].update(
+                other
+                for other in adjacent_cells
+                if self.kb.value(self.precipice(other)) is not False
+            )
+        else:
+            for other in adjacent_cells:
+                self.kb.tell([-self.precipice(other)])
+
+        if self.monster_gone:
+            return
+        if smelly:
+            self.kb.tell([self.monster(other) for other in adjacent_cells])
+            self.knowledge_base["Monstruo"].update(
+                other
+                for other in adjacent_cells
+                if self.kb.value(self.monster(other)) is not False
+            )
+            # There is a single monster, so it cannot be anywhere else
+            if self.monster_area is None:
+                previous_area = [
+                    (x, y) for x in range(self.dimension) for y in range(self.dimension)
+                ]
+            else:
+                previous_area = self.monster_area
+            self.monster_area = set(adjacent_cells).intersection(previous_area)
+            for other in previous_area:
+                if other not in self.monster_area:
+                    self.kb.tell([-self.monster(other)])
+        else:
+            for other in adjacent_cells:
+                self.kb.tell([-self.monster(other)])
+
+    def sync_knowledge(self):
+        # Update the cell sets with the facts propagated since the last call
+        trail = self.kb.trail
+        for literal in trail[self.trail_seen:]:
+            cell = self.cell_of(abs(literal))
+            if literal > 0:
+                continue
+            if abs(literal) <= self.dimension**2:
+                self.knowledge_base["Precipicios"].discard(cell)
+            else:
+                self.knowledge_base["Monstruo"].discard(cell)
+            if self.kb.value(-self.precipice(cell)) and (
+                self.monster_gone or self.kb.value(-self.monster(cell))
+            ):
+                self.secure_cells.add(cell)
+        self.trail_seen = len(trail)
+        if self.monster_gone:
+            self.knowledge_base["Monstruo"] = set()
 
     def update_kb(self, cell, perception):
         # Update the knowledge base based on perceptions
-        if perception[0]:
-            possible_prec = self.capitan.get_adjacent_cells()
-            for precipice_cell in possible_prec:
-                if (
-                    precipice_cell not in self.secure_cells
-                    and precipice_cell != self.capitan.position
-                ):
-                    self.knowledge_base["Precipicios"].add(precipice_cell)
-        elif perception[1]:
-            possible_monster = self.capitan.get_adjacent_cells()
-            for monster_cell in possible_monster:
-                if (
-                    monster_cell not in self.secure_cells
-                    and monster_cell != self.capitan.position
-                ):
-                    self.knowledge_base["Monstruo"].add(monster_cell)
-        elif not (perception[0] or perception[1]):
-            if cell not in self.secure_cells:
-                self.secure_cells.add(cell)
-                adjacent_secure_cells = self.capitan.get_adjacent_cells()
-                self.secure_cells.update(adjacent_secure_cells)
-        elif perception[8]:
+        if perception[8]:
             self.knowledge_base["Coronel"].add(cell)
 
+        if self.capitan.monster_defeated and not self.monster_gone:
+            # The monster is dead: forget every rule about it
+            self.reset_kb()
+
+        observation = (perception[0], perception[1])
+        previous = self.observations.get(cell)
+        if previous != observation:
+            self.observations[cell] = observation
+            if previous is None:
+                self.tell_observation(cell, *observation)
+            elif previous[0] != observation[0] or not self.monster_gone:
+                self.reset_kb()
+        self.sync_knowledge()
+
     def is_safe_cell(self, cell):
-        # Check if a cell is safe (not dangerous)
-        return cell in self.secure_cells
+        # Check if a cell is safe: the knowledge base entails that it holds
+        # neither a precipice nor the monster
+        if cell in self.secure_cells:
+            return True
+        return self.kb.entails(-self.precipice(cell)) and (
+            self.monster_gone or self.kb.entails(-self.monster(cell))
+        )
+
+    def hazard_probabilities(self, kind):
+        # Exact probability of a hazard ("Precipicios" or "Monstruo") in every
+        # cell that may hold it, computed once for both kinds per state of the KB
+        cache = self.hazard_cache
+        if cache is None or cache[0] is not self.kb or cache[1] != self.kb.version:
+            cache = self.hazard_cache = (self.kb, self.kb.version, self.joint_hazards())
+        return cache[2][kind]
+
+    def joint_hazards(self):
+        # The palace puts the precipices and the monster in distinct cells away
+        # from the entry, so the precipices are counted for every cell of the
+        # monster. Monster cells that cannot hold a precipice all give the same
+        # count, and so do the unconstrained ones; only the monster cells on the
+        # frontier change the constraints and are counted one by one
+        none = {"Precipicios": {}, "Monstruo": {}}
+        count = sum(number for room, number in Palace.elements if room.element == "|:P::|")
+        cells = [(x, y) for x in range(self.dimension) for y in range(self.dimension)]
+        known = {
+            cell: False if cell in self.hazard_free else self.kb.value(self.precipice(cell))
+            for cell in cells
+        }
+        hazards = [cell for cell, value in known.items() if value]
+        remaining = count - len(hazards)
+        if remaining < 0:
+            return none
+
+        constraints = set()
+        for cell, observation in self.observations.items():
+            if not observation[0]:
+                continue
+            adjacent_cells = self.adjacent_cells(cell)
+            if any(known[other] for other in adjacent_cells):
+                continue
+            unknown = frozenset(o for o in adjacent_cells if known[o] is None)
+            if not unknown:
+                return none
+            constraints.add(unknown)
+
+        frontier_cells = set().union(*constraints)
+        unconstrained = [
+            cell for cell, value in known.items() if value is None and cell not in frontier_cells
+        ]
+
+        # Monster cells grouped by how they change the precipice count
+        if self.monster_gone:
+            outside, inside, frontier_monster = [None], [], []
+        else:
+            monster_cells = [
+                cell
+                for cell in cells
+                if cell not in self.hazard_free
+                and self.kb.value(self.monster(cell)) is not False
+            ]
+            outside = [cell for cell in monster_cells if known[cell] is False]
+            inside = [
+                cell
+                for cell in monster_cells
+                if known[cell] is None and cell not in frontier_cells
+            ]
+            frontier_monster = [cell for cell in monster_cells if cell in frontier_cells]
+
+        monster = {}
+        precipices = dict.fromkeys(frontier_cells.union(unconstrained), 0)
+        total = 0
+
+        def add(group, frontier, other, weight, taken=()):
+            # Add the placements of every monster cell of a group, which share
+            # the same count; a taken cell cannot hold a precipice
+            nonlocal total
+            total += weight * len(group)
+            for cell in group:
+                if cell is not None:
+                    monster[cell] = weight
+            for cell, probability in frontier.items():
+                precipices[cell] += weight * len(group) * probability
+            for cell in unconstrained:
+                precipices[cell] += weight * other * (len(group) - (cell in taken))
+
+        if outside:
+            add(outside, *self.risk_solver.probabilities(
+                constraints, len(unconstrained), remaining
+            ))
+        if inside:
+            add(inside, *self.risk_solver.probabilities(
+                constraints, len(unconstrained) - 1, remaining
+            ), taken=set(inside))
+        for cell in frontier_monster:
+            reduced = {constraint - {cell} for constraint in constraints}
+            if frozenset() not in reduced:
+                add([cell], *self.risk_solver.probabilities(
+                    reduced, len(unconstrained), remaining
+                ))
+
+        if total == 0:
+            return none
+        precipices = {cell: weight / total for cell, weight in precipices.items()}
+        precipices.update((cell, 1.0) for cell in hazards)
+        return {
+            "Precipicios": precipices,
+            "Monstruo": {cell: weight / total for cell, weight in monster.items()},
+        }
+
+    def most_probable_locations(self, kind):
+        # Candidate cells with the highest exact probability of a hazard
+        probabilities = self.hazard_probabilities(kind)
+        candidates = {
+            cell: probabilities.get(cell, 0.0) for cell in self.knowledge_base[kind]
+        }
+        if not candidates:
+            return set()
+        highest = max(candidates.values())
+        return {cell for cell, probability in candidates.items() if probability == highest}
 
     def most_probable_precipice_location(self):
         # Get the most probable locations of precipices
-        return self.knowledge_base["Precipicios"]
+        return self.most_probable_locations("Precipicios")
 
     def most_probable_monster_location(self):
         # Get the most probable locations of the monster
-        return self.knowledge_base["Monstruo"]
+        return self.most_probable_locations("Monstruo")
 
     def definitely_dangerous_cells(self):
-        # Get cells that are definitely dangerous (precipice or monster)
-        all_dangerous_cells = self.knowledge_base["Precipicios"].union(
-            self.knowledge_base["Monstruo"]
-        )
-        return all_dangerous_cells - self.secure_cells
+        # Get cells where the knowledge base entails a precipice or the monster
+        dangerous_cells = {
+            cell
+            for cell in self.knowledge_base["Precipicios"]
+            if self.kb.entails(self.precipice(cell))
+        }
+        if not self.monster_gone:
+            dangerous_cells.update(
+                cell
+                for cell in self.knowledge_base["Monstruo"]
+                if self.kb.entails(self.monster(cell))
+            )
+        return dangerous_cells
 
     def logic_agent(self):
         # Provide logical recommendations based on perceptions and knowledge base
@@ -411,3 +1083,390 @@ class LogicAgent:
                 cell for cell in adjacent_cells if self.is_safe_cell(cell)
             ]
             print(f"Celdas adyacentes seguras: {safe_adjacent_cells}")
+
+
+class BitboardWorld:
+    """
+    Class that represents the palace and the agent's knowledge as integer bitmasks
+    """
+
+    # Bits of the compact perception returned by percept_flags
+    BREEZE, SMELL, GLOW = 1, 2, 4
+
+    # Masks and move tables of every dimension, shared by all the worlds
+    tables = {}
+
+    def __init__(self, dimension):
+        # Cell (x, y) is bit x * dimension + y of every mask
+        self.dimension = dimension
+        self.size = dimension * dimension
+        if dimension not in self.tables:
+            self.full = (1 << self.size) - 1
+            first_column = sum(1 << (x * dimension) for x in range(dimension))
+            self.not_first_column = self.full & ~first_column
+            self.not_last_column = self.full & ~(first_column << (dimension - 1))
+            self.tables[dimension] = (
+                self.full,
+                self.not_first_column,
+                self.not_last_column,
+                [self.neighbors(1 << bit) for bit in range(self.size)],
+                {
+                    direction: [self.target(bit, direction) for bit in range(self.size)]
+                    for direction in ("arriba", "abajo", "izquierda", "derecha")
+                },
+            )
+        (
+            self.full,
+            self.not_first_column,
+            self.not_last_column,
+            self.adjacent,
+            self.targets,
+        ) = self.tables[dimension]
+
+        # Contents of the palace
+        self.precipices = 0
+        self.monster = 0
+        self.exit = 0
+        self.kurtz = 0
+
+        # State of Captain Willard
+        self.position = 0
+        self.alive = True
+        self.monster_defeated = False
+        self.kurtz_found = False
+
+        # Knowledge of the agent
+        self.visited = 1
+        self.no_precipice = 1
+        self.no_monster = 1
+        self.breezy = 0
+        self.smelly = 0
+
+    @classmethod
+    def from_palace(cls, palace, captain=None):
+        # Build the bitboards from a Palace (and the state of a CaptainWillard)
+        world = cls(palace.dimension)
+        masks = {
+            "|:P::|": "precipices",
+            "|:M::|": "monster",
+            "|:S::|": "exit",
+            "|:CK:|": "kurtz",
+        }
+        for element, attribute in masks.items():
+            for x, y in palace.find_element_positions(element):
+                setattr(world, attribute, getattr(world, attribute) | world.bit((x, y)))
+
+        if captain is not None:
+            world.position = world.index(captain.position)
+            world.alive = captain.alive
+            world.monster_defeated = captain.monster_defeated
+            world.kurtz_found = captain.kurtz_found
+            world.visited = world.mask(captain.explored_cells) | world.bit(captain.position)
+            world.no_precipice |= world.visited
+            world.no_monster |= world.visited
+        return world
+
+    @classmethod
+    def from_layout(cls, dimension, layout):
+        # Build the bitboards from a row of random_layouts (flat cell indices of
+        # the exit, the precipices, the monster and Colonel Kurtz)
+        world = cls(dimension)
+        world.exit = 1 << layout[0]
+        for cell in layout[1:-2]:
+            world.precipices |= 1 << cell
+        world.monster = 1 << layout[-2]
+        world.kurtz = 1 << layout[-1]
+        return world
+
+    # Conversions between positions and bits
+
+    def index(self, position):
+        return position[0] * self.dimension + position[1]
+
+    def bit(self, position):
+        return 1 << (position[0] * self.dimension + position[1])
+
+    def mask(self, positions):
+        # Bitmask with the given positions set
+        mask = 0
+        for position in positions:
+            mask |= self.bit(position)
+        return mask
+
+    def cells(self, mask):
+        # Set of (x, y) positions whose bit is set in a mask
+        cells = set()
+        while mask:
+            lowest = mask & -mask
+            cells.add(divmod(lowest.bit_length() - 1, self.dimension))
+            mask ^= lowest
+        return cells
+
+    def neighbors(self, mask):
+        # Cells orthogonally adjacent to any cell of a mask, using shifts
+        n = self.dimension
+        return (
+            ((mask >> n) | (mask << n)) & self.full
+            | (mask >> 1) & self.not_last_column
+            | (mask << 1) & self.not_first_column
+        )
+
+    # Perceptions
+
+    def percept_flags(self):
+        # Breeze, smell and glow of the current cell packed in an integer
+        adjacent = self.adjacent[self.position]
+        flags = 0
+        if adjacent & self.precipices:
+            flags |= self.BREEZE
+        if adjacent & self.monster:
+            flags |= self.SMELL
+        if (adjacent | 1 << self.position) & self.exit:
+            flags |= self.GLOW
+        return flags
+
+    def get_perception(self):
+        # Same perception list as CaptainWillard.get_perception
+        flags = self.percept_flags()
+        x, y = divmod(self.position, self.dimension)
+        return [
+            bool(flags & self.BREEZE),
+            bool(flags & self.SMELL),
+            bool(flags & self.GLOW),
+            x == 0,
+            x == self.dimension - 1,
+            y == 0,
+            y == self.dimension - 1,
+            False,
+            self.kurtz_found,
+        ]
+
+    # Actions
+
+    def target(self, bit, direction):
+        # Bit index reached by moving in a direction, or None if there is a wall
+        n = self.dimension
+        x, y = divmod(bit, n)
+        if direction == "arriba":
+            return bit - n if x > 0 else None
+        elif direction == "abajo":
+            return bit + n if x < n - 1 else None
+        elif direction == "izquierda":
+            return bit - 1 if y > 0 else None
+        elif direction == "derecha":
+            return bit + 1 if y < n - 1 else None
+
+    def move(self, direction):
+        # Move Captain Willard; returns False if the move hits a wall
+        target = self.targets[direction][self.position]
+        if target is None:
+            return False
+
+        cell = 1 << target
+        self.position = target
+        self.visited |= cell
+        if cell & (self.precipices | self.monster):
+            self.alive = False
+        elif cell & self.kurtz:
+            self.kurtz = 0
+            self.kurtz_found = True
+        return True
+
+    def detonate(self):
+        # Defeat the monster if it is adjacent to Captain Willard
+        if self.adjacent[self.position] & self.monster:
+            self.monster = 0
+            self.monster_defeated = True
+            self.no_monster = self.full
+            return True
+        return False
+
+    def exit_palace(self):
+        # Leave the palace from the exit cell; returns True if the mission is won
+        if (1 << self.position) & self.exit:
+            self.alive = False
+            return self.kurtz_found
+        return False
+
+    # Knowledge base
+
+    def update_knowledge(self, flags=None):
+        # Add the perception of the current cell to the knowledge masks
+        if flags is None:
+            flags = self.percept_flags()
+        cell = 1 << self.position
+        adjacent = self.adjacent[self.position]
+
+        self.no_precipice |= cell
+        self.no_monster |= cell
+        if flags & self.BREEZE:
+            self.breezy |= cell
+        else:
+            self.no_precipice |= adjacent
+        if flags & self.SMELL:
+            self.smelly |= cell
+            # There is a single monster, so it cannot be anywhere else
+            self.no_monster |= self.full & ~adjacent
+        else:
+            self.no_monster |= adjacent
+
+    @property
+    def secure(self):
+        # Cells known to hold neither a precipice nor the monster
+        return self.no_precipice & self.no_monster
+
+    @property
+    def possible_precipices(self):
+        # Unknown cells next to a breeze
+        return self.neighbors(self.breezy) & ~self.no_precipice
+
+    @property
+    def possible_monster(self):
+        # Unknown cells next to a smell
+        if self.monster_defeated:
+            return 0
+        return self.neighbors(self.smelly) & ~self.no_monster
+
+    def definitely_dangerous(self):
+        # Cells that are the only unknown neighbor of a breeze or a smell
+        dangerous = 0
+        for perceived, known in (
+            (self.breezy, self.no_precipice),
+            (self.smelly if not self.monster_defeated else 0, self.no_monster),
+        ):
+            while perceived:
+                lowest = perceived & -perceived
+                candidates = self.adjacent[lowest.bit_length() - 1] & ~known
+                if candidates and not candidates & (candidates - 1):
+                    dangerous |= candidates
+                perceived ^= lowest
+        return dangerous
+
+
+class AutonomousAgent:
+    """
+    Class that represents a logical agent that plays on its own over a BitboardWorld
+    """
+
+    def __init__(self, world):
+        # Initialize the agent with the world it plays in and an empty plan
+        self.world = world
+        self.plan = []
+        self.turns = 0
+
+    @classmethod
+    def from_palace(cls, palace, captain=None):
+        # Build the agent on the bitboards of a Palace
+        return cls(BitboardWorld.from_palace(palace, captain))
+
+    def path_to(self, goal):
+        # Shortest path (list of bit indices) over secure cells from Captain
+        # Willard to the nearest cell of the goal mask, or None if unreachable
+        world = self.world
+        reached = 1 << world.position
+        if reached & goal:
+            return []
+        secure = world.secure
+        layers = [reached]
+        while True:
+            layer = world.neighbors(layers[-1]) & secure & ~reached
+            if not layer:
+                return None
+            reached |= layer
+            layers.append(layer)
+            if layer & goal:
+                break
+
+        # Walk back from the goal choosing any neighbor in the previous layer
+        cell = (layers[-1] & goal & -(layers[-1] & goal)).bit_length() - 1
+        path = [cell]
+        for layer in reversed(layers[1:-1]):
+            previous = world.adjacent[cell] & layer
+            cell = (previous & -previous).bit_length() - 1
+            path.append(cell)
+        path.reverse()
+        return path
+
+    def direction_to(self, target):
+        # Direction of the move from Captain Willard to an adjacent cell
+        step = target - self.world.position
+        if step == -self.world.dimension:
+            return "arriba"
+        elif step == self.world.dimension:
+            return "abajo"
+        elif step == -1:
+            return "izquierda"
+        return "derecha"
+
+    def choose_action(self):
+        # Choose the next action from the knowledge masks: ("mover", direction),
+        # ("detonar",), ("salir",) or None if there is nothing safe left to do
+        world = self.world
+        if world.smelly >> world.position & 1 and not world.monster_defeated:
+            return ("detonar",)
+
+        known_exit = world.exit & world.visited
+        if world.kurtz_found and known_exit:
+            if (1 << world.position) & known_exit:
+                return ("salir",)
+            if not self.plan or not (1 << self.plan[-1]) & known_exit:
+                self.plan = self.path_to(known_exit) or []
+
+        if not self.plan:
+            self.plan = self.path_to(world.secure & ~world.visited) or []
+
+        if not self.plan:
+            # Nothing safe left to explore: give up from the exit if it is known
+            if known_exit:
+                if (1 << world.position) & known_exit:
+                    return ("salir",)
+                self.plan = self.path_to(known_exit) or []
+            if not self.plan:
+                return None
+
+        return ("mover", self.direction_to(self.plan.pop(0)))
+
+    def step(self):
+        # Perceive, update the knowledge masks and perform one action
+        world = self.world
+        world.update_knowledge()
+        action = self.choose_action()
+        if action is None:
+            return None
+
+        self.turns += 1
+        if action[0] == "mover":
+            world.move(action[1])
+        elif action[0] == "detonar":
+            world.detonate()
+        else:
+            world.exit_palace()
+        return action
+
+    def play(self, max_turns=None):
+        # Play a whole game without printing anything and return its outcome:
+        # "victoria", "rendido", "muerto", "atascado" or "sin turnos"
+        # Every plan ends in a new cell, so the game always ends without max_turns
+        world = self.world
+        while world.alive:
+            if max_turns is not None and self.turns >= max_turns:
+                return "sin turnos"
+            action = self.step()
+            if action is None:
+                return "atascado"
+            if action[0] == "salir":
+                return "victoria" if world.kurtz_found else "rendido"
+        return "muerto"
+
+
+def evaluate_autonomous_agent(games, dimension=6, max_turns=None, seed=None):
+    # Play many headless games and count the outcomes and the turns played
+    outcomes = {}
+    turns = 0
+    for layouts in random_layouts(games, dimension, seed):
+        for layout in layouts.tolist():
+            agent = AutonomousAgent(BitboardWorld.from_layout(dimension, layout))
+            outcome = agent.play(max_turns)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            turns += agent.turns
+    return {"partidas": games, "turnos": turns, "resultados": outcomes}
@@ -0,0 +1,197 @@
+"""
+benchmark_buscador.py
+
+Fundamentos de Inteligencia Artificial - IMAT
+ICAI, Universidad Pontificia Comillas
+
+Proyecto realizado por Lydia Ruiz Martínez
+
+Descripción:
+Banco de pruebas del agente buscador. Mide nodos expandidos, tamaño máximo
+de la frontera, memoria máxima y tiempo de cada estrategia, y guarda los
+resultados en un fichero JSON para comparar versiones.
+Invocable con el comando "python benchmark_buscador.py".
+"""
+
+# Import necessary modules
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import agente_buscador as bus
+
+# Default grid sizes and goal placements of the suite
+TAMANOS = [6, 64, 256, 1024, 4096]
+COLOCACIONES = ["esquina", "centro", "aleatoria"]
+
+
+def posicion_objetivo(colocacion, dimension, semilla):
+    # Goal position for a placement: far corner, center or seeded random cell
+    if colocacion == "esquina":
+        return dimension - 1, dimension - 1
+    if colocacion == "centro":
+        return dimension // 2, dimension // 2
+    return bus.Environment(dimension, semilla=semilla).goal
+
+
+def ejecutar_caso(estrategia, dimension, objetivo, obstaculos, semilla, medir_memoria):
+    # Run one strategy on one environment and collect its metrics
+    entorno = bus.Environment(
+        dimension, obstaculos=obstaculos, semilla=semilla, objetivo=objetivo
+    )
+    agente = bus.SEARCH_AGENTS[estrategia](entorno)
+    inicio = time.perf_counter()
+    nodo_objetivo = agente.search()
+    tiempo = time.perf_counter() - inicio
+
+    resultado = {
+        "estrategia": estrategia,
+        "dimension": dimension,
+        "objetivo": list(entorno.goal),
+        "obstaculos": obstaculos,
+        "longitud": None if nodo_objetivo is None else nodo_objetivo.cost,
+        "nodos_expandidos": agente.nodes_expanded,
+        "frontera_maxima": agente.peak_frontier,
+        "tiempo": tiempo,
+        "memoria_maxima": None,
+    }
+
+    # tracemalloc slows the search down, so memory is measured on a second run
+    if medir_memoria:
+        entorno = bus.Environment(
+            dimension, obstaculos=obstaculos, semilla=semilla, objetivo=objetivo
+        )
+        tracemalloc.start()
+        bus.SEARCH_AGENTS[estrategia](entorno).search()
+        resultado["memoria_maxima"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return resultado
+
+
+def version_codigo():
+    # Commit of the code being measured, if it is a git checkout
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ejecutar_benchmark(
+    tamanos=TAMANOS,
+    colocaciones=COLOCACIONES,
+    estrategias=None,
+    obstaculos=0.0,
+    semilla=0,
+    medir_memoria=True,
+    informar=None,
+):
+    # Run every strategy on every size and goal placement
+    # obstaculos is the fraction of cells turned into obstacles
+    estrategias = estrategias or list(bus.SEARCH_AGENTS)
+    resultados = []
+    for dimension in tamanos:
+        for colocacion in colocaciones:
+            objetivo = posicion_objetivo(colocacion, dimension, semilla)
+            cantidad = int(obstaculos * dimension * dimension)
+            for estrategia in estrategias:
+                resultado = ejecutar_caso(
+                    estrategia, dimension, objetivo, cantidad, semilla, medir_memoria
+                )
+                resultado["colocacion"] = colocacion
+                resultados.append(resultado)
+                if informar is not None:
+                    informar(resultado)
+
+    return {
+        "version": version_codigo(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "resultados": resultados,
+    }
+
+
+def comparar(anterior, actual):
+    # Ratio between the metrics of two benchmark files for the cases they share
+    def clave(resultado):
+        return (
+            resultado["estrategia"],
+            resultado["dimension"],
+            resultado["colocacion"],
+            resultado["obstaculos"],
+        )
+
+    previos = {clave(resultado): resultado for resultado in anterior["resultados"]}
+    comparacion = []
+    for resultado in actual["resultados"]:
+        previo = previos.get(clave(resultado))
+        if previo is None:
+            continue
+        fila = {"caso": list(clave(resultado))}
+        for metrica in ("nodos_expandidos", "frontera_maxima", "tiempo", "memoria_maxima"):
+            if previo[metrica] and resultado[metrica] is not None:
+                fila[metrica] = resultado[metrica] / previo[metrica]
+        comparacion.append(fila)
+    return comparacion
+
+
+def main(argumentos=None):
+    # Command line interface of the benchmark suite
+    parser = argparse.ArgumentParser(description="Banco de pruebas del agente buscador.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS)
+    parser.add_argument(
+        "--colocaciones", nargs="+", default=COLOCACIONES, choices=COLOCACIONES
+    )
+    parser.add_argument(
+        "--estrategias", nargs="+", default=None, choices=list(bus.SEARCH_AGENTS)
+    )
+    parser.add_argument(
+        "--obstaculos", type=float, default=0.0, help="fracción de celdas bloqueadas"
+    )
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument(
+        "--sin-memoria", action="store_true", help="no medir la memoria con tracemalloc"
+    )
+    parser.add_argument("--salida", default="benchmark_buscador.json")
+    parser.add_argument("--comparar", help="resultados anteriores con los que comparar")
+    argumentos = parser.parse_args(argumentos)
+
+    def informar(resultado):
+        print(
+            f"{resultado['estrategia']:>20} n={resultado['dimension']:<5} "
+            f"{resultado['colocacion']:<9} nodos={resultado['nodos_expandidos']:<9} "
+            f"frontera={resultado['frontera_maxima']:<8} "
+            f"tiempo={resultado['tiempo']:.4f}s memoria={resultado['memoria_maxima']}"
+        )
+
+    informe = ejecutar_benchmark(
+        argumentos.tamanos,
+        argumentos.colocaciones,
+        argumentos.estrategias,
+        argumentos.obstaculos,
+        argumentos.semilla,
+        not argumentos.sin_memoria,
+        informar,
+    )
+    with open(argumentos.salida, "w", encoding="utf-8") as fichero:
+        json.dump(informe, fichero, indent=2)
+
+    if argumentos.comparar:
+        with open(argumentos.comparar, encoding="utf-8") as fichero:
+            anterior = json.load(fichero)
+        for fila in comparar(anterior, informe):
+            print(json.dumps(fila))
+
+
+if __name__ == "__main__":
+    main()
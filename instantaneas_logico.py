@@ -0,0 +1,283 @@
+"""
+instantaneas_logico.py
+
+Fundamentos de Inteligencia Artificial - IMAT
+ICAI, Universidad Pontificia Comillas
+
+Proyecto realizado por Lydia Ruiz Martínez
+
+Descripción:
+Instantáneas binarias del agente lógico (palacio, Capitán Willard y
+conocimiento del agente) para guardar partidas, recuperarlas y bifurcarlas.
+Cada instantánea tiene una cabecera fija, un byte por celda del tablero y un
+conjunto de bits por cada conjunto de conocimiento, así que todas las de una
+misma dimensión ocupan lo mismo y un fichero de instantáneas se puede leer con
+mmap sin procesarlo entero.
+"""
+
+# Import necessary modules
+
+import mmap
+import os
+import struct
+
+from colorama import Fore
+
+import agente_logico as log
+
+# Header: magic, format version, dimension, Captain Willard's position and flags
+HEADER = struct.Struct("<4sBHHHB")
+MAGIC = b"KRTZ"
+VERSION = 1
+
+# Flags of the header
+ALIVE, MONSTER_DEFEATED, KURTZ_FOUND, MONSTER_GONE = 1, 2, 4, 8
+
+# Board cell codes: code 1 is the entry cell, which looks like a base cell
+ROOM_CODES = {
+    "|::::|": 0,
+    "|:S::|": 2,
+    "|:P::|": 3,
+    "|:M::|": 4,
+    "|:CW:|": 5,
+    "|:CK:|": 6,
+    "|CWCK|": 7,
+}
+ENTRY_CODE = 1
+
+# Bitsets stored after the board, in this order: explored cells, secure cells,
+# possible precipices, possible monster, Kurtz, observed cells, breeze, smell
+KNOWLEDGE_SETS = 8
+
+
+def bitset_size(dimension):
+    # Bytes of a bitset with one bit per cell
+    return (dimension * dimension + 7) // 8
+
+
+def record_size(dimension):
+    # Size in bytes of every snapshot of a palace of a given dimension
+    return HEADER.size + dimension * dimension + KNOWLEDGE_SETS * bitset_size(dimension)
+
+
+def to_bitset(cells, dimension):
+    # Bytes of the bitset with the bit x * dimension + y set for every cell
+    mask = 0
+    for x, y in cells:
+        mask |= 1 << (x * dimension + y)
+    return mask.to_bytes(bitset_size(dimension), "little")
+
+
+def from_bitset(data, dimension):
+    # Cells whose bit is set in a bitset
+    mask = int.from_bytes(data, "little")
+    cells = []
+    while mask:
+        lowest = mask & -mask
+        cells.append(divmod(lowest.bit_length() - 1, dimension))
+        mask ^= lowest
+    return cells
+
+
+def dumps(agent):
+    # Snapshot of a LogicAgent with its CaptainWillard and Palace as bytes
+    captain = agent.capitan
+    palace = captain.palace
+    dimension = palace.dimension
+
+    flags = 0
+    if captain.alive:
+        flags |= ALIVE
+    if captain.monster_defeated:
+        flags |= MONSTER_DEFEATED
+    if captain.kurtz_found:
+        flags |= KURTZ_FOUND
+    if agent.monster_gone:
+        flags |= MONSTER_GONE
+    header = HEADER.pack(MAGIC, VERSION, dimension, *captain.position, flags)
+
+    board = bytes(
+        ENTRY_CODE if room is palace.entry_cell else ROOM_CODES[room.element]
+        for row in palace.board
+        for room in row
+    )
+
+    observations = agent.observations
+    knowledge = b"".join(
+        to_bitset(cells, dimension)
+        for cells in (
+            captain.explored_cells,
+            agent.secure_cells,
+            agent.knowledge_base["Precipicios"],
+            agent.knowledge_base["Monstruo"],
+            agent.knowledge_base["Coronel"],
+            observations,
+            [cell for cell, (breezy, _) in observations.items() if breezy],
+            [cell for cell, (_, smelly) in observations.items() if smelly],
+        )
+    )
+    return header + board + knowledge
+
+
+def read_header(data):
+    # Dimension, Captain Willard's position and flags of a snapshot
+    magic, version, dimension, x, y, flags = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a logical agent snapshot")
+    return dimension, (x, y), flags
+
+
+def loads(data):
+    # Rebuild a LogicAgent (with its CaptainWillard and Palace) from a snapshot
+    dimension, position, flags = read_header(data)
+    if len(data) < record_size(dimension):
+        raise ValueError("truncated logical agent snapshot")
+
+    palace = log.Palace(dimension, generate=False)
+    rooms = [palace.base_cell, palace.entry_cell, palace.exit_cell]
+    rooms += [room for room, _ in log.Palace.elements]
+    rooms.append(log.Room("|CWCK|", Fore.LIGHTYELLOW_EX, (0, 0)))
+    rooms_by_code = {
+        0: rooms[0],
+        ENTRY_CODE: rooms[1],
+        ROOM_CODES["|:S::|"]: rooms[2],
+    }
+    for room in rooms[3:]:
+        rooms_by_code[ROOM_CODES[room.element]] = room
+
+    offset = HEADER.size
+    for cell, code in enumerate(data[offset : offset + dimension * dimension]):
+        if code:
+            palace.set_room(divmod(cell, dimension), rooms_by_code[code])
+    offset += dimension * dimension
+
+    size = bitset_size(dimension)
+    (
+        explored,
+        secure,
+        precipices,
+        monster,
+        kurtz,
+        observed,
+        breezy,
+        smelly,
+    ) = (
+        from_bitset(data[offset + i * size : offset + (i + 1) * size], dimension)
+        for i in range(KNOWLEDGE_SETS)
+    )
+
+    captain = log.CaptainWillard(palace)
+    captain.position = position
+    captain.alive = bool(flags & ALIVE)
+    captain.monster_defeated = bool(flags & MONSTER_DEFEATED)
+    captain.kurtz_found = bool(flags & KURTZ_FOUND)
+    captain.explored_cells = explored
+
+    # The propositional knowledge base is rebuilt from the observations
+    agent = log.LogicAgent(captain)
+    breezy, smelly = set(breezy), set(smelly)
+    agent.observations = {cell: (cell in breezy, cell in smelly) for cell in observed}
+    agent.reset_kb()
+    agent.monster_gone = bool(flags & MONSTER_GONE)
+    agent.secure_cells = set(secure)
+    agent.knowledge_base = {
+        "Precipicios": set(precipices),
+        "Monstruo": set(monster),
+        "Coronel": set(kurtz),
+    }
+    return agent
+
+
+def clone(agent):
+    # Independent copy of a LogicAgent, its CaptainWillard and its Palace
+    # without going through bytes; rooms are shared because they never change
+    old_palace = agent.capitan.palace
+    palace = log.Palace(old_palace.dimension, generate=False)
+    palace.base_cell = old_palace.base_cell
+    palace.entry_cell = old_palace.entry_cell
+    palace.exit_cell = old_palace.exit_cell
+    palace.board = [list(row) for row in old_palace.board]
+    palace.element_positions = {
+        element: set(positions)
+        for element, positions in old_palace.element_positions.items()
+    }
+
+    old_captain = agent.capitan
+    captain = log.CaptainWillard(palace)
+    captain.position = old_captain.position
+    captain.alive = old_captain.alive
+    captain.monster_defeated = old_captain.monster_defeated
+    captain.kurtz_found = old_captain.kurtz_found
+    captain.explored_cells = list(old_captain.explored_cells)
+
+    copy = log.LogicAgent(captain)
+    copy.secure_cells = set(agent.secure_cells)
+    copy.knowledge_base = {kind: set(cells) for kind, cells in agent.knowledge_base.items()}
+    copy.observations = dict(agent.observations)
+    copy.kb = agent.kb.copy()
+    copy.trail_seen = agent.trail_seen
+    copy.monster_gone = agent.monster_gone
+    copy.monster_area = None if agent.monster_area is None else set(agent.monster_area)
+    # The risk solver only memoizes counts, so it can be shared
+    copy.risk_solver = agent.risk_solver
+    return copy
+
+
+def write_snapshots(path, agents, append=False):
+    # Store the snapshots of several agents (of the same dimension) in a file
+    size = None
+    with open(path, "ab" if append else "wb") as file:
+        for agent in agents:
+            data = dumps(agent)
+            if size is not None and len(data) != size:
+                raise ValueError("all the snapshots of a file must have the same dimension")
+            size = len(data)
+            file.write(data)
+
+
+class SnapshotFile:
+    """
+    Class that represents a file of snapshots read on demand through a memory map
+    """
+
+    def __init__(self, path):
+        # Map the file; the dimension of the first snapshot fixes the record size
+        self.file = open(path, "rb")
+        self.map = None
+        self.record_size = 0
+        if os.fstat(self.file.fileno()).st_size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.record_size = record_size(read_header(self.map)[0])
+
+    def __len__(self):
+        # Number of snapshots in the file
+        if self.map is None:
+            return 0
+        return len(self.map) // self.record_size
+
+    def record(self, index):
+        # Bytes of a snapshot, copied from the map without reading the others
+        if not 0 <= index < len(self):
+            raise IndexError("snapshot index out of range")
+        start = index * self.record_size
+        return self.map[start : start + self.record_size]
+
+    def header(self, index):
+        # Dimension, Captain Willard's position and flags of a snapshot
+        return read_header(self.record(index)[: HEADER.size])
+
+    def __getitem__(self, index):
+        # Rebuild the agent stored in a snapshot
+        return loads(self.record(index))
+
+    def close(self):
+        # Release the map and the file
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
@@ -12,9 +12,13 @@ Código principal del proyecto invocable con el comando "python kurtz.py".
 
 # Importing three different modules for logical agent, bayesian agent, and search agent
 
+import os
+import random
+
 import agente_logico as log
 import agente_bayesiano as bay
 import agente_buscador as bus
+import trazas_logico as trz
 
 # Checking if the script is being run as the main module
 
@@ -33,14 +37,24 @@ if __name__ == "__main__":
         if action == "agente lógico":
             valid_action = True
             # Creating instances of the logical agent classes and setting up the game environment
-            palace = log.Palace(dimension=6)
+            # If KURTZ_TRAZA names a file, the seed and every turn are appended
+            # to it to replay the game later
+            seed = random.randrange(2**32)
+            palace = log.Palace(dimension=6, seed=seed)
             willard = log.CaptainWillard(palace)
             logic_agent = log.LogicAgent(willard)
+            recorder = None
+            trace_path = os.environ.get("KURTZ_TRAZA")
+            if trace_path:
+                recorder = trz.TraceRecorder(trace_path, logic_agent, seed)
 
             # Displaying the initial state of the game palace
-            palace.display_palace()
-            print(" ")
-            palace.display_palace_player(willard.position)
+            # (only the cells that change are redrawn afterwards)
+            renderer = log.PalaceRenderer(palace)
+            renderer.start()
+            if recorder is not None:
+                print(f"La partida se grabará en {os.path.abspath(trace_path)}")
+            renderer.draw(willard.position)
 
             # Main game loop for logical agent gameplay
             while willard.alive:
@@ -59,8 +73,9 @@ if __name__ == "__main__":
                         willard.move(direction)
                         if willard.alive:
                             logic_agent.logic_agent()
-                        palace.display_palace()
-                        palace.display_palace_player(willard.position)
+                        if recorder is not None:
+                            recorder.record(direction)
+                        renderer.draw(willard.position)
                     else:
                         print(
                             "Dirección no válida. Por favor, ingresa una dirección válida."
@@ -68,16 +83,21 @@ if __name__ == "__main__":
                 elif action == "detonar":
                     willard.detonate()
                     logic_agent.logic_agent()
-                    palace.display_palace()
-                    palace.display_palace_player(willard.position)
+                    if recorder is not None:
+                        recorder.record(action)
+                    renderer.draw(willard.position)
                 elif action == "salir":
                     willard.exit_palace()
                     logic_agent.logic_agent()
-                    palace.display_palace()
-                    palace.display_palace_player(willard.position)
+                    if recorder is not None:
+                        recorder.record(action)
+                    renderer.draw(willard.position)
                 else:
                     print("Acción no válida. Las opciones son: mover, detonar, salir.")
 
+            if recorder is not None:
+                recorder.close()
+            renderer.stop()
             print("Juego terminado. Gracias por jugar.")
 
         # Code for Bayesian agent gameplay
@@ -136,8 +156,19 @@ if __name__ == "__main__":
             # Creating instances of the search agent classes and setting up the game environment
             environment = bus.Environment(dimension=6)
             environment.imprimir()
-            agent = bus.AgentBFS(environment)
-            agent.solve()
+
+            # Asking the user for the search strategy used by the agent
+            strategies = ", ".join(bus.SEARCH_AGENTS)
+            strategy = input(
+                f"Ingresa la estrategia de búsqueda ({strategies}): "
+            ).lower()
+            while strategy not in bus.SEARCH_AGENTS:
+                strategy = input(
+                    f"Estrategia no válida. Las opciones son: {strategies}: "
+                ).lower()
+
+            agent = bus.SEARCH_AGENTS[strategy](environment)
+            agent.solve(render=True)
 
         # Handling the case when an invalid gameplay mode is entered
         else:
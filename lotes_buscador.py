@@ -0,0 +1,165 @@
+"""
+lotes_buscador.py
+
+Fundamentos de Inteligencia Artificial - IMAT
+ICAI, Universidad Pontificia Comillas
+
+Proyecto realizado por Lydia Ruiz Martínez
+
+Descripción:
+Resolución en paralelo de lotes de entornos con el agente buscador.
+Invocable con el comando "python lotes_buscador.py --mapas N".
+"""
+
+# Import necessary modules
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import agente_buscador as bus
+
+
+def crear_entorno(especificacion, dimension, obstaculos):
+    # Build an environment from a seed (generated map) or from exported data (loaded map)
+    if isinstance(especificacion, dict):
+        return bus.Environment.importar(especificacion)
+    return bus.Environment(dimension, obstaculos=obstaculos, semilla=especificacion)
+
+
+def resolver_bloque(bloque, estrategia, dimension, obstaculos):
+    # Solve a block of maps inside a worker process without printing anything
+    resultados = []
+    for numero, especificacion in bloque:
+        entorno = crear_entorno(especificacion, dimension, obstaculos)
+        agente = bus.SEARCH_AGENTS[estrategia](entorno)
+
+        inicio = time.perf_counter()
+        nodo_objetivo = agente.search()
+        tiempo = time.perf_counter() - inicio
+
+        resultados.append(
+            {
+                "mapa": numero,
+                "dimension": entorno.dimension,
+                "longitud": None if nodo_objetivo is None else nodo_objetivo.cost,
+                "nodos_expandidos": agente.nodes_expanded,
+                "tiempo": tiempo,
+            }
+        )
+    return resultados
+
+
+def dividir_en_bloques(especificaciones, tamano_bloque):
+    # Number the maps and group them in lists of tamano_bloque maps
+    numerados = enumerate(especificaciones)
+    while True:
+        bloque = list(itertools.islice(numerados, tamano_bloque))
+        if not bloque:
+            return
+        yield bloque
+
+
+def resolver_lote(
+    especificaciones,
+    estrategia="anchura",
+    dimension=6,
+    obstaculos=0,
+    procesos=None,
+    tamano_bloque=16,
+):
+    # Solve every map in a process pool and yield the results as they finish
+    # Maps are sent in blocks and only a few blocks are in flight at a time,
+    # so the parent never holds the whole batch in memory
+    procesos = procesos or os.cpu_count() or 1
+    bloques = dividir_en_bloques(especificaciones, tamano_bloque)
+
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        pendientes = set()
+        for bloque in itertools.islice(bloques, 2 * procesos):
+            pendientes.add(
+                ejecutor.submit(resolver_bloque, bloque, estrategia, dimension, obstaculos)
+            )
+
+        while pendientes:
+            terminados, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                yield from futuro.result()
+                bloque = next(bloques, None)
+                if bloque is not None:
+                    pendientes.add(
+                        ejecutor.submit(
+                            resolver_bloque, bloque, estrategia, dimension, obstaculos
+                        )
+                    )
+
+
+def cargar_entornos(ruta):
+    # Read, one by one, the environments stored in a JSON lines file
+    with open(ruta, encoding="utf-8") as fichero:
+        for linea in fichero:
+            if linea.strip():
+                yield json.loads(linea)
+
+
+def guardar_entornos(ruta, semillas, dimension, obstaculos):
+    # Generate environments from their seeds and store them in a JSON lines file
+    with open(ruta, "w", encoding="utf-8") as fichero:
+        for semilla in semillas:
+            entorno = bus.Environment(dimension, obstaculos=obstaculos, semilla=semilla)
+            fichero.write(json.dumps(entorno.exportar()) + "\n")
+
+
+def main(argumentos=None):
+    # Command line interface of the batch solver
+    parser = argparse.ArgumentParser(
+        description="Resuelve en paralelo un lote de entornos con el agente buscador."
+    )
+    parser.add_argument("--mapas", type=int, default=100, help="número de mapas a generar")
+    parser.add_argument("--dimension", type=int, default=6, help="dimensión de cada mapa")
+    parser.add_argument("--obstaculos", type=int, default=0, help="obstáculos por mapa")
+    parser.add_argument("--semilla", type=int, default=0, help="semilla del primer mapa")
+    parser.add_argument(
+        "--estrategia",
+        default="anchura",
+        choices=list(bus.SEARCH_AGENTS),
+        help="estrategia de búsqueda",
+    )
+    parser.add_argument("--procesos", type=int, default=None, help="procesos del pool")
+    parser.add_argument("--bloque", type=int, default=16, help="mapas por envío")
+    parser.add_argument("--cargar", help="fichero JSON lines con los mapas a resolver")
+    parser.add_argument(
+        "--guardar", help="genera los mapas en un fichero JSON lines sin resolverlos"
+    )
+    argumentos = parser.parse_args(argumentos)
+
+    semillas = range(argumentos.semilla, argumentos.semilla + argumentos.mapas)
+    if argumentos.guardar:
+        guardar_entornos(
+            argumentos.guardar, semillas, argumentos.dimension, argumentos.obstaculos
+        )
+        return
+
+    if argumentos.cargar:
+        especificaciones = cargar_entornos(argumentos.cargar)
+    else:
+        especificaciones = semillas
+
+    for resultado in resolver_lote(
+        especificaciones,
+        argumentos.estrategia,
+        argumentos.dimension,
+        argumentos.obstaculos,
+        argumentos.procesos,
+        argumentos.bloque,
+    ):
+        sys.stdout.write(json.dumps(resultado) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+test_agente_buscador.py
+
+Fundamentos de Inteligencia Artificial - IMAT
+ICAI, Universidad Pontificia Comillas
+
+Proyecto realizado por Lydia Ruiz Martínez
+
+Descripción:
+Pruebas de regresión del agente buscador.
+Invocable con el comando "python -m unittest test_agente_buscador".
+"""
+
+# Import necessary modules
+
+import unittest
+from collections import deque
+
+import agente_buscador as bus
+
+
+def bfs_rank(dimension, start, goal):
+    # Position of the goal in the order in which a plain BFS dequeues the
+    # cells, moving up, down, left and right like the agent does
+    seen = {start}
+    queue = deque([start])
+    rank = 0
+    while queue:
+        x, y = queue.popleft()
+        rank += 1
+        if (x, y) == goal:
+            return rank
+        for cell in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if 0 <= cell[0] < dimension and 0 <= cell[1] < dimension and cell not in seen:
+                seen.add(cell)
+                queue.append(cell)
+    return None
+
+
+class TestAgentBFS(unittest.TestCase):
+    """
+    Class that represents the regression tests of the Breadth-First Search agent
+    """
+
+    def check_expansions(self, environment):
+        # Every cell is expanded at most once, so the goal is reached after
+        # exactly as many expansions as its rank in the BFS order
+        agent = bus.AgentBFS(environment)
+        goal_node = agent.search()
+        dimension = environment.dimension
+
+        self.assertIsNotNone(goal_node)
+        self.assertEqual(
+            goal_node.cost,
+            abs(environment.goal[0] - environment.start[0])
+            + abs(environment.goal[1] - environment.start[1]),
+        )
+        self.assertLessEqual(agent.nodes_expanded, dimension**2)
+        self.assertEqual(
+            agent.nodes_expanded,
+            bfs_rank(dimension, environment.start, environment.goal),
+        )
+
+    def test_expansions_seeded_1000(self):
+        self.check_expansions(bus.Environment(1000, semilla=2024))
+
+    def test_expansions_far_corner_1000(self):
+        self.check_expansions(bus.Environment(1000, objetivo=(999, 999)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,268 @@
+"""
+trazas_logico.py
+
+Fundamentos de Inteligencia Artificial - IMAT
+ICAI, Universidad Pontificia Comillas
+
+Proyecto realizado por Lydia Ruiz Martínez
+
+Descripción:
+Grabación y reproducción de partidas del agente lógico. Cada turno se añade a
+un registro binario (solo de escritura al final) con registros precedidos de su
+longitud: semilla, acción, percepción y cambios en el conocimiento del agente,
+más instantáneas periódicas para saltar directamente a cualquier turno.
+"""
+
+# Import necessary modules
+
+import contextlib
+import io
+import struct
+
+import instantaneas_logico as ins
+
+# Every record is its length followed by its kind and its body
+LENGTH = struct.Struct("<I")
+START, KEYFRAME, TURN = b"S", b"K", b"T"
+
+# Bodies: seed and dimension of a game, turn of a keyframe, and the fixed part
+# of a turn (turn, action and perception bits) followed by the knowledge deltas
+START_BODY = struct.Struct("<BqH")
+KEYFRAME_BODY = struct.Struct("<I")
+TURN_BODY = struct.Struct("<IBH")
+COUNT = struct.Struct("<I")
+
+ACTIONS = ("arriba", "abajo", "izquierda", "derecha", "detonar", "salir")
+
+# Knowledge deltas of a turn, in the order they are stored
+DELTAS = (
+    "seguras",
+    "precipicios añadidos",
+    "precipicios descartados",
+    "monstruo añadido",
+    "monstruo descartado",
+    "coronel",
+)
+
+
+def play_turn(agent, action):
+    # Perform an action with the agent's Captain Willard and update the
+    # knowledge base as kurtz.py does, without printing anything
+    captain = agent.capitan
+    with contextlib.redirect_stdout(io.StringIO()):
+        if action == "detonar":
+            captain.detonate()
+        elif action == "salir":
+            captain.exit_palace()
+        else:
+            captain.move(action)
+            if not captain.alive:
+                return
+        agent.update_kb(captain.position, captain.get_perception())
+
+
+def knowledge_of(agent):
+    # Copy of the knowledge sets that are tracked turn by turn
+    return (
+        set(agent.secure_cells),
+        set(agent.knowledge_base["Precipicios"]),
+        set(agent.knowledge_base["Monstruo"]),
+        set(agent.knowledge_base["Coronel"]),
+    )
+
+
+def knowledge_deltas(before, after):
+    # Cells added to or removed from the knowledge sets, as in DELTAS
+    return (
+        after[0] - before[0],
+        after[1] - before[1],
+        before[1] - after[1],
+        after[2] - before[2],
+        before[2] - after[2],
+        after[3] - before[3],
+    )
+
+
+def encode_turn(turn, action, perception, deltas, dimension):
+    # Body of a turn record
+    bits = sum(1 << i for i, value in enumerate(perception) if value)
+    parts = [TURN, TURN_BODY.pack(turn, ACTIONS.index(action), bits)]
+    for cells in deltas:
+        indices = sorted(x * dimension + y for x, y in cells)
+        parts.append(COUNT.pack(len(indices)))
+        parts.append(struct.pack(f"<{len(indices)}I", *indices))
+    return b"".join(parts)
+
+
+def decode_turn(body, dimension):
+    # Turn number, action, perception and knowledge deltas of a turn record
+    turn, action, bits = TURN_BODY.unpack_from(body, 1)
+    decoded = {
+        "turno": turn,
+        "accion": ACTIONS[action],
+        "percepcion": [bool(bits >> i & 1) for i in range(9)],
+    }
+    offset = 1 + TURN_BODY.size
+    for name in DELTAS:
+        (count,) = COUNT.unpack_from(body, offset)
+        offset += COUNT.size
+        indices = struct.unpack_from(f"<{count}I", body, offset)
+        offset += 4 * count
+        decoded[name] = {divmod(index, dimension) for index in indices}
+    return decoded
+
+
+class TraceRecorder:
+    """
+    Class that represents the recorder of a logical agent game in an append-only trace
+    """
+
+    def __init__(self, path, agent, seed=None, keyframe_interval=32):
+        # Open the trace for appending and write the start of a new game
+        self.file = open(path, "ab")
+        self.agent = agent
+        self.dimension = agent.capitan.palace.dimension
+        self.keyframe_interval = keyframe_interval
+        self.turn = 0
+        self.knowledge = knowledge_of(agent)
+
+        has_seed = seed is not None
+        self.write(START + START_BODY.pack(has_seed, seed if has_seed else 0, self.dimension))
+        self.write_keyframe()
+
+    def write(self, body):
+        # Append a length-prefixed record
+        self.file.write(LENGTH.pack(len(body)))
+        self.file.write(body)
+
+    def write_keyframe(self):
+        # Append a snapshot of the game at the current turn
+        self.write(KEYFRAME + KEYFRAME_BODY.pack(self.turn) + ins.dumps(self.agent))
+        self.file.flush()
+
+    def record(self, action):
+        # Append the turn just played: its action, the perception after it and
+        # what the agent learnt from it
+        self.turn += 1
+        knowledge = knowledge_of(self.agent)
+        self.write(
+            encode_turn(
+                self.turn,
+                action,
+                self.agent.capitan.get_perception(),
+                knowledge_deltas(self.knowledge, knowledge),
+                self.dimension,
+            )
+        )
+        self.knowledge = knowledge
+        if self.turn % self.keyframe_interval == 0:
+            self.write_keyframe()
+
+    def close(self):
+        # Flush and close the trace
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+class TraceReplayer:
+    """
+    Class that represents the replayer of the games stored in a trace
+    """
+
+    def __init__(self, path):
+        # Index the records of every game reading only their lengths and kinds
+        self.file = open(path, "rb")
+        self.games = []
+        offset = 0
+        while True:
+            self.file.seek(offset)
+            prefix = self.file.read(LENGTH.size + 1)
+            if len(prefix) < LENGTH.size + 1:
+                break
+            (length,) = LENGTH.unpack_from(prefix)
+            kind = prefix[LENGTH.size : LENGTH.size + 1]
+            if kind == START:
+                self.games.append({"inicio": offset, "fotogramas": [], "turnos": []})
+            elif kind == KEYFRAME:
+                (turn,) = KEYFRAME_BODY.unpack(self.file.read(KEYFRAME_BODY.size))
+                self.games[-1]["fotogramas"].append((turn, offset))
+            else:
+                self.games[-1]["turnos"].append(offset)
+            offset += LENGTH.size + length
+
+    def __len__(self):
+        # Number of games in the trace
+        return len(self.games)
+
+    def read(self, offset):
+        # Body of the record stored at an offset
+        self.file.seek(offset)
+        (length,) = LENGTH.unpack(self.file.read(LENGTH.size))
+        return self.file.read(length)
+
+    def start(self, game):
+        # Seed (or None) and dimension of a game
+        body = self.read(self.games[game]["inicio"])
+        has_seed, seed, dimension = START_BODY.unpack_from(body, 1)
+        return (seed if has_seed else None), dimension
+
+    def turns(self, game, first=1):
+        # Decoded turns of a game from a turn on, without executing them
+        dimension = self.start(game)[1]
+        for offset in self.games[game]["turnos"][first - 1 :]:
+            yield decode_turn(self.read(offset), dimension)
+
+    def keyframe(self, game, turn):
+        # Agent of the last keyframe at or before a turn, and the turn it holds
+        best = None
+        for keyframe_turn, offset in self.games[game]["fotogramas"]:
+            if keyframe_turn > turn:
+                break
+            best = keyframe_turn, offset
+        keyframe_turn, offset = best
+        body = self.read(offset)
+        return ins.loads(body[1 + KEYFRAME_BODY.size :]), keyframe_turn
+
+    def replay(self, game, first=0, last=None):
+        # Execute again the turns of a game from a keyframe, checking that the
+        # perceptions and the knowledge deltas match the trace; yields the
+        # turn and the agent after it (the agent is the same object every time)
+        agent, turn = self.keyframe(game, first)
+        dimension = self.start(game)[1]
+        if first == turn:
+            yield turn, agent
+        knowledge = knowledge_of(agent)
+        for recorded in self.turns(game, turn + 1):
+            if last is not None and recorded["turno"] > last:
+                return
+            play_turn(agent, recorded["accion"])
+            after = knowledge_of(agent)
+            deltas = knowledge_deltas(knowledge, after)
+            knowledge = after
+            if agent.capitan.get_perception() != recorded["percepcion"] or any(
+                delta != recorded[name] for name, delta in zip(DELTAS, deltas)
+            ):
+                raise ValueError(f"the game diverges from the trace at turn {recorded['turno']}")
+            if recorded["turno"] >= first:
+                yield recorded["turno"], agent
+
+    def seek(self, game, turn):
+        # Agent in the state after a turn, replayed from the nearest keyframe
+        for _, agent in self.replay(game, turn, turn):
+            return agent
+        raise IndexError("turn out of range")
+
+    def close(self):
+        # Close the trace
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()